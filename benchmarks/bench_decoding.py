@@ -0,0 +1,218 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gitlabApi import records
+from gitlabApi.records import JobRecord, ProjectRecord
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare decoding GitLab pages into dicts and into records")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--per-page", type=int, default=100)
+    return parser.parse_args()
+
+
+# a runner job as GitLab returns it, with the nested objects the exporter never reads
+def make_job(job_id):
+    user = {
+        "id": 42,
+        "username": "developer",
+        "name": "Developer",
+        "state": "active",
+        "avatar_url": "https://gitlab.example.com/uploads/-/system/user/avatar/42/avatar.png",
+        "web_url": "https://gitlab.example.com/developer",
+        "created_at": "2020-01-01T00:00:00.000Z",
+        "bio": "",
+        "location": "",
+        "public_email": "",
+        "organization": "",
+        "job_title": "",
+    }
+    return {
+        "id": job_id,
+        "status": "success",
+        "stage": "test",
+        "name": "unit-tests",
+        "ref": "main",
+        "tag": False,
+        "coverage": None,
+        "allow_failure": False,
+        "created_at": "2023-08-01T10:00:00.000Z",
+        "started_at": "2023-08-01T10:00:05.000Z",
+        "finished_at": "2023-08-01T10:02:05.000Z",
+        "erased_at": None,
+        "duration": 120.123,
+        "queued_duration": 5.321,
+        "user": user,
+        "commit": {
+            "id": "6104942438c14ec7bd21c6cd5bd995272b3faff6",
+            "short_id": "61049424",
+            "created_at": "2023-08-01T09:59:00.000Z",
+            "parent_ids": ["c6cd5bd995272b3faff66104942438c14ec7bd21"],
+            "title": "Fix the flaky test",
+            "message": "Fix the flaky test\n\nThe test waited on a fixed sleep.\n",
+            "author_name": "Developer",
+            "author_email": "developer@example.com",
+            "authored_date": "2023-08-01T09:59:00.000Z",
+            "committer_name": "Developer",
+            "committer_email": "developer@example.com",
+            "committed_date": "2023-08-01T09:59:00.000Z",
+            "trailers": {},
+            "web_url": "https://gitlab.example.com/group/project/-/commit/6104942438c14ec7bd21c6cd5bd995272b3faff6",
+        },
+        "pipeline": {
+            "id": job_id // 3,
+            "iid": 1000,
+            "project_id": 7,
+            "sha": "6104942438c14ec7bd21c6cd5bd995272b3faff6",
+            "ref": "main",
+            "status": "success",
+            "source": "push",
+            "created_at": "2023-08-01T10:00:00.000Z",
+            "updated_at": "2023-08-01T10:02:05.000Z",
+            "web_url": f"https://gitlab.example.com/group/project/-/pipelines/{job_id // 3}",
+        },
+        "project": {
+            "id": 7,
+            "name": "project",
+            "name_with_namespace": "group / project",
+            "path": "project",
+            "path_with_namespace": "group/project",
+            "created_at": "2020-01-01T00:00:00.000Z",
+        },
+        "artifacts_file": {"filename": "artifacts.zip", "size": 1000},
+        "artifacts": [
+            {"file_type": "archive", "size": 1000, "filename": "artifacts.zip", "file_format": "zip"},
+            {"file_type": "metadata", "size": 186, "filename": "metadata.gz", "file_format": "gzip"},
+            {"file_type": "junit", "size": 1024, "filename": "junit.xml.gz", "file_format": "gzip"},
+        ],
+        "artifacts_expire_at": "2023-08-31T10:02:05.000Z",
+        "tag_list": ["docker", "linux"],
+        "runner": {
+            "id": 5,
+            "description": "shared-runner",
+            "ip_address": "10.0.0.5",
+            "active": True,
+            "paused": False,
+            "is_shared": True,
+            "runner_type": "instance_type",
+            "name": "gitlab-runner",
+            "online": True,
+            "status": "online",
+        },
+        "web_url": f"https://gitlab.example.com/group/project/-/jobs/{job_id}",
+    }
+
+
+# a group project as GitLab returns it, only the id, path and namespace are read
+def make_project(project_id):
+    project = {
+        "id": project_id,
+        "description": "A project of the group",
+        "name": f"project-{project_id}",
+        "name_with_namespace": f"group / project-{project_id}",
+        "path": f"project-{project_id}",
+        "path_with_namespace": f"group/project-{project_id}",
+        "created_at": "2020-01-01T00:00:00.000Z",
+        "default_branch": "main",
+        "tag_list": [],
+        "topics": [],
+        "ssh_url_to_repo": f"git@gitlab.example.com:group/project-{project_id}.git",
+        "http_url_to_repo": f"https://gitlab.example.com/group/project-{project_id}.git",
+        "web_url": f"https://gitlab.example.com/group/project-{project_id}",
+        "readme_url": f"https://gitlab.example.com/group/project-{project_id}/-/blob/main/README.md",
+        "avatar_url": None,
+        "forks_count": 0,
+        "star_count": 0,
+        "last_activity_at": "2023-08-01T10:02:05.000Z",
+        "namespace": {
+            "id": 3,
+            "name": "group",
+            "path": "group",
+            "kind": "group",
+            "full_path": "group",
+            "parent_id": None,
+            "avatar_url": None,
+            "web_url": "https://gitlab.example.com/groups/group",
+        },
+        "_links": {
+            name: f"https://gitlab.example.com/api/v4/projects/{project_id}/{name}"
+            for name in ("self", "issues", "merge_requests", "repo_branches", "labels", "events", "members")
+        },
+    }
+    project.update({f"{feature}_access_level": "enabled" for feature in (
+        "issues", "repository", "merge_requests", "forking", "wiki", "builds", "snippets", "pages",
+        "operations", "analytics", "requirements", "security_and_compliance", "container_registry",
+    )})
+    project.update({f"{flag}_enabled": True for flag in (
+        "packages", "empty_repo", "archived", "lfs", "request_access", "shared_runners",
+        "container_registry", "service_desk", "merge_trains", "auto_devops",
+    )})
+    return project
+
+
+# Function to decode every page and keep the decoded items, as a page is kept while it's processed
+def measure(bodies, decode_page):
+    gc.collect()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    peak = 0
+    kept = []
+    for body in bodies:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        kept.append(decode_page(body))
+        _, page_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, page_peak - before)
+    elapsed = time.perf_counter() - started_at
+    retained, _ = tracemalloc.get_traced_memory()
+    retained_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    pages = len(bodies)
+    return {
+        "ms_per_page": elapsed * 1000 / pages,
+        "peak_kib_per_page": peak / 1024,
+        "retained_kib_per_page": retained / 1024 / pages,
+        "retained_blocks_per_page": retained_blocks / pages,
+    }
+
+
+def main():
+    args = parse_args()
+    pages = {
+        "runner jobs": (
+            [json.dumps([make_job(page * args.per_page + index) for index in range(args.per_page)]).encode()
+             for page in range(args.pages)],
+            JobRecord,
+        ),
+        "group projects": (
+            [json.dumps([make_project(page * args.per_page + index) for index in range(args.per_page)]).encode()
+             for page in range(args.pages)],
+            ProjectRecord,
+        ),
+    }
+    decoders = {"dicts (json)": lambda body, record_class: json.loads(body)}
+    decoders["records (json)"] = lambda body, record_class: [record_class(item) for item in json.loads(body)]
+    if records.loads is not json.loads:
+        decoders["records (orjson)"] = lambda body, record_class: records.decode(body, record_class)
+
+    print(f"{args.pages} pages of {args.per_page} items, orjson {'installed' if len(decoders) > 2 else 'not installed'}")
+    for page_name, (bodies, record_class) in pages.items():
+        print(f"\n{page_name}")
+        print(f"{'decoder':<18} {'ms/page':>10} {'peak KiB/page':>15} {'kept KiB/page':>15} {'kept blocks/page':>18}")
+        for decoder_name, decoder in decoders.items():
+            result = measure(bodies, lambda body: decoder(body, record_class))
+            print(
+                f"{decoder_name:<18} {result['ms_per_page']:>10.2f} {result['peak_kib_per_page']:>15.1f} "
+                f"{result['retained_kib_per_page']:>15.1f} {result['retained_blocks_per_page']:>18.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from prometheus_client import CollectorRegistry, generate_latest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus.exporter import PrometheusExporter
+
+LABELNAMES = [
+    "group_id",
+    "runner_description",
+    "job_id",
+    "job_name",
+    "path_with_namespace",
+    "source",
+    "pipeline_id",
+    "ref",
+    "status",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare per-series and bulk ingestion of job records")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--cycles", type=int, default=3, help="cycles ingested, the best one is reported")
+    return parser.parse_args()
+
+
+# a cycle of job records as fetch_runner_jobs returns them, with the few distinct names, paths and runners
+# a real group has
+def make_records(count):
+    return {
+        job_id: {
+            "group_id": 1 + job_id % 4,
+            "runner_description": f"runner-{job_id % 20}",
+            "job_id": job_id,
+            "job_name": f"job-{job_id % 50}",
+            "ref": "main" if job_id % 5 else f"feature-{job_id % 30}",
+            "status": "success" if job_id % 10 else "failed",
+            "source": "push",
+            "pipeline_id": job_id // 8,
+            "path_with_namespace": f"group/project-{job_id % 200}",
+            "duration": 60.5 + job_id % 600,
+            "queued_duration": 0.25 + job_id % 30,
+        }
+        for job_id in range(count)
+    }
+
+
+# the per-series path collect_metrics took before, three labelled child lookups for every record
+def per_series_exporter():
+    exporter = PrometheusExporter(CollectorRegistry())
+    exporter.add_gauge_metric("gitlab_job_duration_seconds", "Duration", LABELNAMES)
+    exporter.add_gauge_metric("gitlab_job_queued_duration_seconds", "Queued duration", LABELNAMES)
+    exporter.add_counter_metric("gitlab_job_executed_counts", "Executed counts", LABELNAMES)
+
+    def ingest(records):
+        for record_attr in records.values():
+            labels = record_attr.copy()
+            del labels["duration"]
+            del labels["queued_duration"]
+            exporter.set_metric("gitlab_job_duration_seconds", labels, record_attr["duration"])
+            exporter.set_metric(
+                "gitlab_job_queued_duration_seconds", labels, record_attr["queued_duration"]
+            )
+            exporter.increment_metric("gitlab_job_executed_counts", labels)
+
+    return exporter, ingest
+
+
+def columnar_exporter():
+    exporter = PrometheusExporter(CollectorRegistry())
+    exporter.add_record_metrics(
+        "gitlab_job_",
+        LABELNAMES,
+        [
+            ("duration", "gitlab_job_duration_seconds", "Duration"),
+            ("queued_duration", "gitlab_job_queued_duration_seconds", "Queued duration"),
+        ],
+        ("gitlab_job_executed_counts", "Executed counts"),
+    )
+    return exporter, lambda records: exporter.ingest_records("gitlab_job_", records.values())
+
+
+# Function to run the cycles of an approach, every cycle clears the series of the previous one like collect_metrics
+def measure(make_exporter, records, cycles):
+    exporter, ingest = make_exporter()
+    ingest_seconds, render_seconds = [], []
+    for _ in range(cycles):
+        exporter.clear_metrics("gitlab_job_")
+        gc.collect()
+        started_at = time.perf_counter()
+        ingest(records)
+        ingest_seconds.append(time.perf_counter() - started_at)
+        started_at = time.perf_counter()
+        output = generate_latest(exporter.registry)
+        render_seconds.append(time.perf_counter() - started_at)
+
+    exporter.clear_metrics("gitlab_job_")
+    gc.collect()
+    tracemalloc.start()
+    ingest(records)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ingest_seconds": min(ingest_seconds),
+        "render_seconds": min(render_seconds),
+        "retained_mib": retained / 1024 / 1024,
+        "output": output,
+    }
+
+
+def main():
+    args = parse_args()
+    records = make_records(args.records)
+    results = {
+        "per-series labels()": measure(per_series_exporter, records, args.cycles),
+        "columnar bulk ingest": measure(columnar_exporter, records, args.cycles),
+    }
+    print(f"{args.records} job records, best of {args.cycles} cycles")
+    print(f"{'approach':<22} {'ingest s':>10} {'us/record':>10} {'render s':>10} {'kept MiB':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<22} {result['ingest_seconds']:>10.3f} "
+            f"{result['ingest_seconds'] / args.records * 1e6:>10.2f} "
+            f"{result['render_seconds']:>10.3f} {result['retained_mib']:>10.1f}"
+        )
+    # the exposition of both approaches must carry the same series, only the _created timestamps differ
+    outputs = [
+        sorted(line for line in result["output"].decode().splitlines() if "_created" not in line)
+        for result in results.values()
+    ]
+    print(f"same exposition: {outputs[0] == outputs[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus.sketches import SketchStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Accuracy, speed and memory of the windowed duration sketches")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--runners", type=int, default=50)
+    parser.add_argument("--hours", type=float, default=1, help="spread of the finished_at of the records")
+    return parser.parse_args()
+
+
+# job records finished over the last hours, with lognormal durations and queued durations, a few zero
+def make_records(count, runners, hours):
+    generator = random.Random(1)
+    now = time.time()
+    return [
+        {
+            "runner_description": f"runner-{generator.randrange(runners)}",
+            "duration": generator.lognormvariate(5, 1),
+            "queued_duration": 0 if index % 20 == 0 else generator.lognormvariate(2, 1.5),
+            "finished_at": int((now - generator.uniform(0, hours * 3600)) * 1e6),
+        }
+        for index in range(count)
+    ]
+
+
+# Function to get the exact quantiles of the records of every runner over every window, nearest rank
+def exact_quantiles(records, store):
+    current = int(time.time() // store.slice_seconds)
+    exact = {}
+    for window_slices, window in zip(store.window_slices, store.windows):
+        first = (current - window_slices + 1) * store.slice_seconds * 1e6
+        values = {}
+        for record in records:
+            if record["finished_at"] >= first:
+                values.setdefault(record["runner_description"], []).append(record["duration"])
+        for runner, durations in values.items():
+            durations.sort()
+            exact[runner, window] = [
+                durations[int(quantile * (len(durations) - 1))] for quantile in store.quantiles
+            ]
+    return exact
+
+
+def main():
+    args = parse_args()
+    records = make_records(args.records, args.runners, args.hours)
+    store = SketchStore("runner_description", ["duration", "queued_duration"])
+
+    gc.collect()
+    started_at = time.perf_counter()
+    store.observe(records)
+    observe_seconds = time.perf_counter() - started_at
+
+    # memory is measured on a second store, tracemalloc slows the observation down
+    measured_store = SketchStore("runner_description", ["duration", "queued_duration"])
+    gc.collect()
+    tracemalloc.start()
+    measured_store.observe(records)
+    kept, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started_at = time.perf_counter()
+    summaries = store.summarize()
+    summarize_seconds = time.perf_counter() - started_at
+
+    exact = exact_quantiles(records, store)
+    errors = [
+        abs(value / expected - 1)
+        for runner, window, values in summaries
+        for value, expected in zip(values[0][0], exact[runner, window])
+    ]
+    print(f"{args.records} job records over {args.hours}h, {args.runners} runners, windows {store.windows}")
+    print(f"observe            {observe_seconds:.3f}s ({observe_seconds / args.records * 1e6:.2f} us/record)")
+    print(f"summarize          {summarize_seconds * 1000:.1f}ms for {len(summaries)} runner windows")
+    print(f"kept               {kept / 1024:.0f} KiB ({kept / 1024 / len(store):.1f} KiB per runner)")
+    print(f"quantile error     max {max(errors):.2%}, mean {sum(errors) / len(errors):.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gitlabApi.records import PipelineRecord
+from gitlabApi.timestamps import parse_timestamp, slice_window, to_epoch_micros
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare timestamp parsing and window filtering approaches")
+    parser.add_argument("--number", type=int, default=20000, help="calls timed for every approach")
+    parser.add_argument("--per-page", type=int, default=100)
+    return parser.parse_args()
+
+
+def report(name, seconds, number):
+    print(f"{name:<42} {seconds / number * 1e6:>10.3f} us")
+
+
+def main():
+    args = parse_args()
+    now = datetime.now(timezone.utc).replace(microsecond=123000)
+    value = now.strftime("%Y-%m-%dT%H:%M:%S.") + "123Z"
+    start_time = (now - timedelta(minutes=5)).replace(tzinfo=None)
+    window_start = to_epoch_micros(start_time)
+
+    print("parse one finished_at and compare it with the window start")
+    report(
+        "datetime.strptime (previous)",
+        timeit.timeit(lambda: datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ") <= start_time, number=args.number),
+        args.number,
+    )
+    report(
+        "datetime.fromisoformat",
+        timeit.timeit(lambda: datetime.fromisoformat(value) <= now, number=args.number),
+        args.number,
+    )
+    report(
+        "parse_timestamp to epoch microseconds",
+        timeit.timeit(lambda: parse_timestamp(value) <= window_start, number=args.number),
+        args.number,
+    )
+
+    # a page of pipelines sorted by updated_at, about a third of it inside the window
+    page = sorted(
+        (
+            PipelineRecord(
+                {
+                    "id": index,
+                    "updated_at": (now - timedelta(seconds=random.uniform(0, 900))).strftime(
+                        "%Y-%m-%dT%H:%M:%S.%fZ"
+                    ),
+                }
+            )
+            for index in range(args.per_page)
+        ),
+        key=lambda pipeline: pipeline.updated_at,
+        reverse=True,
+    )
+    window_end = to_epoch_micros(now)
+    number = args.number // 10
+    print(f"\ncut a page of {args.per_page} pipelines down to the window")
+    report(
+        "compare every item",
+        timeit.timeit(
+            lambda: [p for p in page if window_start <= p.updated_at <= window_end], number=number
+        ),
+        number,
+    )
+    report(
+        "slice_window binary search",
+        timeit.timeit(lambda: slice_window(page, "updated_at", window_start, window_end), number=number),
+        number,
+    )
+
+
+if __name__ == "__main__":
+    main()
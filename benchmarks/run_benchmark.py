@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import aiohttp
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# summary values compared against a baseline, all of them are better when lower
+TRACKED_RESULTS = (
+    "first_cycle_seconds",
+    "cycle_seconds_p50",
+    "cpu_seconds_p50",
+    "requests_per_cycle",
+    "peak_rss_mb",
+    "scrape_latency_p99_ms",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run collection cycles against the fake GitLab and report their cost")
+    parser.add_argument("--cycles", type=int, default=5, help="collection cycles to run, the first one backfills")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between the start of two cycles")
+    parser.add_argument("--backfill-minutes", type=float, default=30, help="window of the first cycle")
+    parser.add_argument("--simulator-port", type=int, default=18080)
+    parser.add_argument("--scrape-interval", type=float, default=0.1, help="seconds between two scrapes of /metrics")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative increase reported as a regression")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the exporter while benchmarking")
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+# Function to start the fake GitLab in its own process, so the RSS measured here is the exporter's
+def start_simulator(port):
+    return subprocess.Popen(
+        [sys.executable, "-m", "simulator.fake_gitlab"],
+        cwd=REPO_ROOT,
+        env=dict(os.environ, SIM_PORT=str(port)),
+    )
+
+
+async def get_simulator_stats(session, simulator_url):
+    async with session.get(f"{simulator_url}/-/stats") as response:
+        return await response.json()
+
+
+async def wait_for_simulator(session, simulator, simulator_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        if simulator.poll() is not None:
+            raise Exception(f"Fake GitLab exited with {simulator.returncode}")
+        try:
+            return await get_simulator_stats(session, simulator_url)
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+# Function to scrape /metrics until stopped, the latency includes waiting for the shared event loop
+async def scrape_metrics(session, latencies, stop, scrape_interval):
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        async with session.get("http://127.0.0.1:8000/metrics", headers={"Accept-Encoding": "gzip"}) as response:
+            await response.read()
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        await asyncio.sleep(scrape_interval)
+
+
+async def run_benchmark(args):
+    simulator_url = f"http://127.0.0.1:{args.simulator_port}"
+    simulator = start_simulator(args.simulator_port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            stats = await wait_for_simulator(session, simulator, simulator_url)
+            # main reads its configuration when imported
+            os.environ["GITLAB_API_URL"] = f"{simulator_url}/api/v4/"
+            os.environ["GROUP_ID"] = str(stats["root_group_id"])
+            os.environ.setdefault("PRIVATE_ACCESS_TOKEN", "benchmark")
+            os.environ.setdefault("IGNORED_SUBGROUPS_PATH_LIST", "")
+            os.environ["CHECKPOINT_ENABLED"] = "false"
+            sys.path.insert(0, REPO_ROOT)
+            import main
+
+            logging.getLogger().setLevel(args.log_level)
+            main.init_metrics()
+            # as start_fetch does, creates HTTP_CACHE_DIR and reads the responses a previous run left there
+            await main.gitlab_api_interaction.response_cache.load()
+            runner = await main.start_server()
+            backfill_start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+                minutes=args.backfill_minutes
+            )
+            main.last_fetch_times.update(pipeline=backfill_start, job=backfill_start)
+
+            latencies = []
+            stop = asyncio.Event()
+            scraper = asyncio.create_task(scrape_metrics(session, latencies, stop, args.scrape_interval))
+            cycles = []
+            try:
+                for cycle in range(args.cycles):
+                    stats_before = await get_simulator_stats(session, simulator_url)
+                    started_at = time.perf_counter()
+                    cpu_started_at = time.process_time()
+                    # the same cycles the scheduler runs, started together as they are on a shared interval
+                    await asyncio.gather(main.pipeline_cycle(), main.job_cycle())
+                    wall_time = time.perf_counter() - started_at
+                    cpu_time = time.process_time() - cpu_started_at
+                    stats_after = await get_simulator_stats(session, simulator_url)
+                    cycles.append(
+                        {
+                            "cycle": cycle,
+                            "seconds": wall_time,
+                            "cpu_seconds": cpu_time,
+                            "requests": stats_after["requests"] - stats_before["requests"],
+                            "throttled": stats_after["throttled"] - stats_before["throttled"],
+                            "not_modified": stats_after["not_modified"] - stats_before["not_modified"],
+                        }
+                    )
+                    print(
+                        f"cycle {cycle}: {wall_time:.2f}s, {cpu_time:.2f}s CPU, {cycles[-1]['requests']} requests, "
+                        f"{cycles[-1]['throttled']} throttled, {cycles[-1]['not_modified']} not modified",
+                        flush=True,
+                    )
+                    await asyncio.sleep(max(0, args.interval - wall_time))
+            finally:
+                stop.set()
+                await scraper
+                await runner.cleanup()
+                await main.gitlab_api_interaction.response_cache.flush()
+                await main.gitlab_api_interaction.close()
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+    steady_cycles = cycles[1:] or cycles
+    return {
+        "cycles": cycles,
+        "first_cycle_seconds": cycles[0]["seconds"],
+        "cycle_seconds_p50": statistics.median(cycle["seconds"] for cycle in steady_cycles),
+        # CPU of the exporter only, the fake GitLab runs in its own process
+        "cpu_seconds_p50": statistics.median(cycle["cpu_seconds"] for cycle in steady_cycles),
+        "requests_per_cycle": statistics.mean(cycle["requests"] for cycle in steady_cycles),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scrapes": len(latencies),
+        "scrape_latency_p50_ms": percentile(latencies, 0.5),
+        "scrape_latency_p99_ms": percentile(latencies, 0.99),
+        "scrape_latency_max_ms": max(latencies, default=0),
+    }
+
+
+# Function to print the change of the tracked results, returns whether any regressed beyond the threshold
+def compare_with_baseline(results, baseline, threshold):
+    regressed = False
+    for name in TRACKED_RESULTS:
+        before, after = baseline.get(name), results[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        flag = ""
+        if change > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{name:<24} {before:>12.2f} -> {after:>12.2f} ({change:+.1%}){flag}")
+    return regressed
+
+
+def run():
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    for name, value in results.items():
+        if name != "cycles":
+            print(f"{name:<24} {value:>12.2f}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare_with_baseline(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,24 @@
+from collections import OrderedDict
+
+
+# LRU set of keys already handled, shared by the webhook receiver, the reconciliation sweep and the job cycles
+class Deduplicator:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.keys = OrderedDict()
+
+    # Function to remember a key, returns False when it was seen already
+    def first_seen(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return False
+        self.keys[key] = None
+        if len(self.keys) > self.max_size:
+            self.keys.popitem(last=False)
+        return True
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def forget(self, key):
+        self.keys.pop(key, None)
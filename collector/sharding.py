@@ -0,0 +1,34 @@
+import hashlib
+import os
+
+
+# Function to score a key on a shard, the shard with the highest score owns the key
+def get_score(key, shard_index):
+    digest = hashlib.blake2b(f"{key}:{shard_index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+# Rendezvous hashing of projects and runners over the exporter replicas, every replica computes the
+# same owner for a key without talking to the others and a change of the replica count only moves
+# the keys won by the added shard or owned by the removed one
+class Shard:
+    def __init__(self):
+        self.index = int(os.environ.get("SHARD_INDEX", 0))
+        self.count = int(os.environ.get("SHARD_COUNT", 1))
+        if not 0 <= self.index < self.count:
+            raise Exception(f"SHARD_INDEX {self.index} is out of range of SHARD_COUNT {self.count}")
+        # owner of every key seen so far, the same projects and runners come back every cycle
+        self.owners = {}
+
+    def get_owner(self, key):
+        owner = self.owners.get(key)
+        if owner is None:
+            owner = self.owners[key] = max(range(self.count), key=lambda index: get_score(key, index))
+        return owner
+
+    def owns(self, key):
+        return self.count == 1 or self.get_owner(key) == self.index
+
+    # Function to keep the items of this shard, e.g. projects or runners keyed by their id
+    def select(self, items, key_name="id"):
+        return [item for item in items if self.owns(item[key_name])]
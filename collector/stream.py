@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from gitlabApi.retry import GiveUpError
+from prometheus.self_metrics import stream_queue_items
+
+logger = logging.getLogger(__name__)
+
+
+# Function to hand the items of a list over as an async iterator of owners
+async def iter_owners(items):
+    for item in items:
+        yield item
+
+
+# Staged pipeline of a streamed collection cycle:
+# owners (projects, runners or pipelines from the topology) -> workers paging through the API of an owner,
+# cutting the window and building the records -> sink turning batches of records into metrics
+# the stages are connected by bounded queues, a full queue holds the stages before it back
+class RecordStream:
+    def __init__(self, record_type, concurrency):
+        self.record_type = record_type
+        self.concurrency = concurrency
+        self.queue_size = int(os.environ.get("STREAM_QUEUE_SIZE", 1000))
+        # records handed to the sink at once
+        self.batch_size = int(os.environ.get("STREAM_BATCH_SIZE", 500))
+        self.owners = asyncio.Queue(self.concurrency * 2)
+        self.records = asyncio.Queue(self.queue_size)
+        # first give-up of the retry policy, the remaining owners are skipped and the cycle fails with it
+        self.give_up = None
+
+    # Function to run the stages until every owner is collected and every record consumed, owners is an
+    # async iterator, iter_records(owner, *args) an async iterator of (record id, record) and consume
+    # receives dicts of records, a failing owner is logged and skipped like in gather_with_limit, a give-up of
+    # the retry policy fails the run once the records already selected are consumed
+    async def run(self, owners, iter_records, consume, owner_type, *args):
+        workers = [
+            asyncio.create_task(self.collect_owners(iter_records, owner_type, args))
+            for _ in range(self.concurrency)
+        ]
+        sink = asyncio.create_task(self.sink(consume))
+        try:
+            async for owner in owners:
+                await self.owners.put(owner)
+            for _ in workers:
+                await self.owners.put(None)
+            await asyncio.gather(*workers)
+            await self.records.put(None)
+            await sink
+            if self.give_up is not None:
+                raise self.give_up
+        finally:
+            for task in workers + [sink]:
+                task.cancel()
+            stream_queue_items.labels(record_type=self.record_type, queue="owners").set(0)
+            stream_queue_items.labels(record_type=self.record_type, queue="records").set(0)
+
+    async def collect_owners(self, iter_records, owner_type, args):
+        while True:
+            owner = await self.owners.get()
+            if owner is None:
+                return
+            # the owners are still taken so the topology stage is never held back by a full queue
+            if self.give_up is not None:
+                continue
+            try:
+                async for record in iter_records(owner, *args):
+                    await self.records.put(record)
+            except Exception as e:
+                logger.error(f"Error occurred while collecting {owner_type} {owner['id']}: {e}")
+                if isinstance(e, GiveUpError) and self.give_up is None:
+                    self.give_up = e
+
+    # Function to hand the records to consume in batches, whatever is queued when the sink wakes up is taken
+    async def sink(self, consume):
+        while True:
+            record = await self.records.get()
+            if record is None:
+                return
+            batch = {record[0]: record[1]}
+            finished = False
+            while len(batch) < self.batch_size and not self.records.empty():
+                record = self.records.get_nowait()
+                if record is None:
+                    finished = True
+                    break
+                batch[record[0]] = record[1]
+            stream_queue_items.labels(record_type=self.record_type, queue="owners").set(self.owners.qsize())
+            stream_queue_items.labels(record_type=self.record_type, queue="records").set(self.records.qsize())
+            # the sink keeps going so the workers never wait on a queue nobody reads
+            try:
+                consume(batch)
+            except Exception as e:
+                logger.error(f"Error occurred while consuming {self.record_type} records: {e}")
+            if finished:
+                return
+            # consume is synchronous, let the workers refill the queue before the next batch
+            await asyncio.sleep(0)
@@ -0,0 +1,133 @@
+import asyncio
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from aiohttp import web
+from collector.dedup import Deduplicator
+from prometheus.self_metrics import webhook_events, webhook_queue_size
+
+logger = logging.getLogger(__name__)
+
+
+# Receiver of GitLab Pipeline and Job webhook events, turned into the records collect_metrics consumes
+class WebhookReceiver:
+    def __init__(self, mapping_list, shard):
+        self.secret_token = os.environ.get("WEBHOOK_SECRET_TOKEN", "")
+        if not self.secret_token:
+            raise Exception("WEBHOOK_SECRET_TOKEN must be set when webhooks are enabled")
+        self.path = os.environ.get("WEBHOOK_PATH", "/webhook")
+        self.mapping_list = mapping_list
+        self.shard = shard
+        self.queue = asyncio.Queue(int(os.environ.get("WEBHOOK_QUEUE_SIZE", 10000)))
+        self.deduplicator = Deduplicator(int(os.environ.get("WEBHOOK_DEDUP_SIZE", 100000)))
+        self.job_collection_mode = os.environ.get("JOB_COLLECTION_MODE", "runners")
+        # LRU of pipeline id -> source filled from pipeline events, job events don't carry the source and
+        # their pipeline's events arrive before they finish
+        self.pipeline_sources = OrderedDict()
+        self.pipeline_sources_size = int(os.environ.get("WEBHOOK_PIPELINE_SOURCES_SIZE", 10000))
+
+    # Function to remember the source of a pipeline for its job events
+    def remember_pipeline_source(self, pipeline_id, source):
+        self.pipeline_sources[pipeline_id] = source
+        self.pipeline_sources.move_to_end(pipeline_id)
+        if len(self.pipeline_sources) > self.pipeline_sources_size:
+            self.pipeline_sources.popitem(last=False)
+
+    # Function to turn a Pipeline Hook payload into a pipeline record, None when it isn't ours
+    def get_pipeline_record(self, payload):
+        attributes = payload["object_attributes"]
+        project = payload["project"]
+        group_id = self.mapping_list.get(project["id"])
+        if group_id is None:
+            return None
+        # remembered before the shard check, in runners mode the jobs of the pipeline can be owned here
+        if attributes.get("source") is not None:
+            self.remember_pipeline_source(attributes["id"], attributes["source"])
+        if not self.shard.owns(project["id"]):
+            return None
+        return {
+            "group_id": group_id,
+            "path_with_namespace": project["path_with_namespace"],
+            "source": attributes.get("source"),
+            "ref": attributes["ref"],
+            "pipeline_id": attributes["id"],
+            "status": attributes["status"],
+            "duration": attributes.get("duration") or 0,
+            "queued_duration": attributes.get("queued_duration") or 0,
+        }
+
+    # Function to turn a Job Hook payload into a job record, jobs are sharded like the polled ones, by runner
+    # or by project in pipelines mode
+    def get_job_record(self, payload):
+        runner = payload.get("runner") or {}
+        group_id = self.mapping_list.get(payload["project_id"])
+        if group_id is None or "id" not in runner:
+            return None
+        owner_id = payload["project_id"] if self.job_collection_mode == "pipelines" else runner["id"]
+        if not self.shard.owns(owner_id):
+            return None
+        return {
+            "group_id": group_id,
+            "runner_description": runner.get("description"),
+            "job_id": payload["build_id"],
+            "job_name": payload["build_name"],
+            "ref": payload["ref"],
+            "status": payload["build_status"],
+            # job events don't carry the pipeline source, it's taken from the pipeline events seen before
+            "source": self.pipeline_sources.get(payload["pipeline_id"], "unknown"),
+            "pipeline_id": payload["pipeline_id"],
+            "path_with_namespace": payload["project"]["path_with_namespace"],
+            "duration": payload.get("build_duration") or 0,
+            "queued_duration": payload.get("build_queued_duration") or 0,
+        }
+
+    # aiohttp handler of the webhook, accepted events are queued and applied by the consumer
+    async def handle(self, request):
+        token = request.headers.get("X-Gitlab-Token", "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            webhook_events.labels(kind="unknown", result="unauthorized").inc()
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            payload = await request.json()
+            kind = payload.get("object_kind")
+            if kind == "pipeline":
+                record_type, record = "pipeline", self.get_pipeline_record(payload)
+            elif kind == "build":
+                record_type, record = "job", self.get_job_record(payload)
+            else:
+                record_type, record = kind, None
+        except Exception as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            webhook_events.labels(kind="unknown", result="invalid").inc()
+            return web.Response(status=400, text="Invalid payload")
+
+        if record is None:
+            webhook_events.labels(kind=str(record_type), result="ignored").inc()
+            return web.Response(status=202, text="Ignored")
+        record_id = record[f"{record_type}_id"]
+        key = (record_type, record_id, record["status"])
+        if not self.deduplicator.first_seen(key):
+            webhook_events.labels(kind=record_type, result="duplicate").inc()
+            return web.Response(status=202, text="Duplicate")
+        try:
+            self.queue.put_nowait((record_type, record_id, record))
+        except asyncio.QueueFull:
+            # GitLab disables webhooks failing repeatedly, the reconciliation sweep picks the event up instead
+            self.deduplicator.forget(key)
+            webhook_events.labels(kind=record_type, result="dropped").inc()
+            return web.Response(status=202, text="Dropped")
+        webhook_events.labels(kind=record_type, result="accepted").inc()
+        webhook_queue_size.set(self.queue.qsize())
+        return web.Response(status=202, text="Accepted")
+
+    # Function to wait for queued records and take every record queued meanwhile, grouped by record type
+    async def get_records(self):
+        records = {"pipeline": {}, "job": {}}
+        record_type, record_id, record = await self.queue.get()
+        records[record_type][record_id] = record
+        while not self.queue.empty():
+            record_type, record_id, record = self.queue.get_nowait()
+            records[record_type][record_id] = record
+        webhook_queue_size.set(0)
+        return records
@@ -1,13 +1,19 @@
-from datetime import datetime
-import json
-import random
 import asyncio
-import functools
 import logging
-import requests
+import aiohttp
 import os
 import sys
 import time
+from gitlabApi.http_cache import ResponseCache
+from gitlabApi.inflight import InflightTracker
+from gitlabApi.pagination import paginate
+from gitlabApi.records import JobRecord, PipelineRecord, ProjectRecord, decode
+from gitlabApi.retry import GiveUpError, RetryPolicy, endpoint_template
+from gitlabApi.timestamps import format_timestamp, slice_window, to_epoch_micros
+from gitlabApi.tokens import TokenPool
+from gitlabApi.topology import GroupTopology
+from collector.dedup import Deduplicator
+from prometheus.self_metrics import request_duration, requests_total
 
 # logger config
 log_format = "%(asctime)s.%(msecs)03dZ [%(levelname)s] %(message)s"
@@ -15,401 +21,599 @@ logging.basicConfig(
     stream=sys.stdout, level=logging.INFO, format=log_format, datefmt="%Y-%m-%dT%H:%M:%S"
 )
 logger = logging.getLogger(__name__)
+# pipeline and job statuses which don't have finished_at yet
+UNFINISHED_STATUSES = {
+    "created",
+    "waiting_for_resource",
+    "preparing",
+    "pending",
+    "running",
+    "scheduled",
+    "manual",
+}
 class GitlabApiInteraction:
     def __init__(self):
         # base URL
-        self.GITLAB_API_URL = "https://gitlab.com/api/v4/"
+        self.GITLAB_API_URL = os.environ.get("GITLAB_API_URL", "https://gitlab.com/api/v4/")
         self.ignored_subgroup_path_list = os.environ.get('IGNORED_SUBGROUPS_PATH_LIST').split(',')
+        # connection pool settings shared by every request of the exporter
+        self.max_connections = int(os.environ.get("GITLAB_MAX_CONNECTIONS", 100))
+        self.max_connections_per_host = int(os.environ.get("GITLAB_MAX_CONNECTIONS_PER_HOST", 20))
+        self.keepalive_timeout = float(os.environ.get("GITLAB_KEEPALIVE_TIMEOUT_SECONDS", 60))
+        self.request_timeout = float(os.environ.get("GITLAB_REQUEST_TIMEOUT_SECONDS", 30))
+        self.http_compression = os.environ.get("GITLAB_HTTP_COMPRESSION", "true").lower() == "true"
+        # maximum number of projects or runners collected at the same time
+        self.collect_concurrency = int(os.environ.get("COLLECT_CONCURRENCY", 10))
+        # "traverse" walks every pipeline by id, "updated_window" lists only pipelines updated in the window
+        self.pipeline_collection_mode = os.environ.get("PIPELINE_COLLECTION_MODE", "traverse")
+        self.pipeline_details_batch_size = int(os.environ.get("PIPELINE_DETAILS_BATCH_SIZE", 20))
+        self.pipeline_details_stats = {"listed": 0, "fetched": 0}
+        # "runners" walks the jobs of every group runner, "pipelines" lists the jobs of the pipelines
+        # finished in the pipeline cycles
+        self.job_collection_mode = os.environ.get("JOB_COLLECTION_MODE", "runners")
+        # finished pipelines whose jobs the next job cycle collects in pipelines mode
+        self.pipelines_for_jobs = []
+        # pipelines handed to the current job cycle, kept until their jobs' metrics are collected
+        self.pipelines_in_job_cycle = []
+        # pipeline id -> ids of the jobs collected from it, for the pipelines whose jobs were listed in the cycle
+        self.listed_pipeline_jobs = {}
+        self.collected_job_ids = Deduplicator(int(os.environ.get("JOB_DEDUP_SIZE", 100000)))
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
-        self.PRIVATE_TOKEN = self.select_private_token()
+        self.session = None
+        self.token_pool = TokenPool(
+            [token.strip() for token in os.environ.get("PRIVATE_ACCESS_TOKEN", "").split(",")]
+        )
+        self.retry_policy = RetryPolicy(len(self.token_pool))
         self.unfinished_jobs = {}
         self.unfinished_pipelines = {}
+        # project_id -> group_id index kept between cycles and refreshed with the topology
         self.mapping_list = {}
-        self.subgroups = []
-        self.projects = []
+        self.topologies = {}
+        self.response_cache = ResponseCache()
     
-    # Function to reset the class
-    def reset_init(self):
-        self.PRIVATE_TOKEN = self.select_private_token()
-        self.mapping_list = {}
-        self.subgroups = []
-        self.projects = []
-    
-    # Function to select a private token from the list
-    def select_private_token(self):
-        retries = 3
-        for _ in range(retries):
-            token = self.get_random_token()
-            if self.check_api_token_status(token):
-                return token
-            logger.warning("Token is not available")
-        logger.error("All tokens are unavailable")
-        raise Exception("All tokens are unavailable")
-
-    # Function to get a random token from the list
-    def get_random_token(self):
-        PRIVATE_TOKENS = os.environ.get('PRIVATE_ACCESS_TOKEN')
-        token_list = PRIVATE_TOKENS.split(',')
-        random.shuffle(token_list)
-        return token_list[0]
-
-    # Function to check if the token is available
-    def check_api_token_status(self, token):
-        url = f"{self.GITLAB_API_URL}user"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": token})
-        if response.status_code == 429:
-            time.sleep(1)  # Add a delay to avoid hitting the rate limit too quickly
-        elif response.status_code == 200:
-            return True
-        return False
-
-    # Shared function for using asyncio to fetch items
-    async def fetch_items_in_executor(self, function_to_run, *args):
+    # Function to get the shared keep-alive session, it must be created inside the running loop
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            accept_encoding = "gzip, deflate" if self.http_compression else "identity"
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                headers={"Accept-Encoding": accept_encoding},
+                auto_decompress=True,
+            )
+        return self.session
+
+    # Function to close the shared session and its pooled connections
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    # Shared function to send a GET request to the GitLab API under the retry policy
+    async def get(self, path, params=None, record_class=None):
+        body, _ = await self.get_page(path, params, record_class)
+        return body
+
+    # Shared function to send a GET request under the retry policy and keep the pagination headers,
+    # path may also be a full url taken from a Link header
+    async def get_page(self, path, params=None, record_class=None):
+        if path.startswith(self.GITLAB_API_URL):
+            path = path[len(self.GITLAB_API_URL):]
+        return await self.retry_policy.call(path, self.request, path, params, record_class)
+
+    # Function to send one GET request with the token that has the most headroom and decode the json body,
+    # into compact records when a record class is given, a cached response makes the request conditional
+    # and its body is reused when GitLab answers 304 Not Modified, only the errors worth retrying are raised,
+    # the others (404, 403...) give an empty body so the item or owner is skipped
+    async def request(self, path, params=None, record_class=None):
+        session = self.get_session()
+        token = await self.token_pool.acquire()
+        endpoint = endpoint_template(path)
+        cache_key = self.response_cache.key(path, params, record_class)
+        cached = await self.response_cache.lookup(cache_key, record_class)
+        headers = {"PRIVATE-TOKEN": token}
+        if cached is not None:
+            headers.update(cached.conditions())
+        started_at = time.monotonic()
         try:
-            loop = asyncio.get_event_loop()
-            # Use functools.partial to fix the args
-            partial_function = functools.partial(function_to_run, *args)
-            items = await loop.run_in_executor(None, partial_function)
-            if not items:
-                self.logger.info(f"{function_to_run.__name__} got empty response")
-            else:
-                return items
-        except Exception as e:
-            logger.error(f"Error occurred: {e}")
-
-    # Function to get subgroups within a group
-    def get_group_subgroups(self, group_id, page):
-        per_page = 100
-        url = f"{self.GITLAB_API_URL}groups/{group_id}/subgroups?per_page={per_page}&page={page}"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
-
-    # Function to get projects within a group or subgroup
-    def get_group_projects(self, group_id, page):
-        per_page = 100
-        url = f"{self.GITLAB_API_URL}groups/{group_id}/projects?per_page={per_page}&page={page}"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
-
-        if response.status_code == 200:
-            return response.json()
+            async with session.get(
+                f"{self.GITLAB_API_URL}{path}", params=params, headers=headers
+            ) as response:
+                self.token_pool.update(token, response.status, response.headers)
+                requests_total.labels(endpoint=endpoint, status=str(response.status)).inc()
+                if response.status == 304 and cached is not None:
+                    self.response_cache.hit(endpoint)
+                    return cached.body, cached.headers
+                if response.status == 200:
+                    raw_body = await response.read()
+                    body = decode(raw_body, record_class)
+                    self.response_cache.store(cache_key, endpoint, response.headers, raw_body, body)
+                    return body, response.headers
+                response.raise_for_status()
+                logger.warning(f"Error occurred: {response.status}")
+                return None, response.headers
+        except aiohttp.ClientResponseError as e:
+            if self.retry_policy.classify(e) is not None:
+                raise
+            logger.warning(f"Skipping {path}: {e.status} {e.message}")
+            return None, e.headers or {}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            requests_total.labels(endpoint=endpoint, status="error").inc()
+            raise
+        finally:
+            request_duration.labels(endpoint=endpoint).observe(time.monotonic() - started_at)
+
+    # Shared function for awaiting a fetch coroutine and logging empty responses
+    async def fetch_items(self, function_to_run, *args):
+        items = await function_to_run(*args)
+        if not items:
+            self.logger.info(f"{function_to_run.__name__} got empty response")
         else:
-            response.raise_for_status()
+            return items
+
+    # Shared function to run a collector for every item concurrently and merge the results,
+    # a failing item is logged and skipped so it doesn't abort the others, unless the retry policy gave up
+    # on it, then the cycle fails so its window isn't lost
+    async def gather_with_limit(self, collector, items, item_type, *args):
+        semaphore = asyncio.Semaphore(self.collect_concurrency)
+
+        async def run_collector(item):
+            async with semaphore:
+                return await collector(item, *args)
+
+        results = await asyncio.gather(
+            *(run_collector(item) for item in items), return_exceptions=True
+        )
+        merged_results = {}
+        give_up = None
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error occurred while collecting {item_type} {item['id']}: {result}")
+                if isinstance(result, GiveUpError) and give_up is None:
+                    give_up = result
+                continue
+            merged_results.update(result)
+        if give_up is not None:
+            raise give_up
+        return merged_results
+
+    # Shared function to collect every page of a list endpoint
+    async def get_all_pages(self, pages):
+        items = []
+        async for page_items in pages:
+            items.extend(page_items)
+        return items
+
+    # Function to iterate over the pages of subgroups within a group
+    def get_group_subgroups(self, group_id):
+        return paginate(self, f"groups/{group_id}/subgroups")
+
+    # Function to iterate over the pages of projects within a group or subgroup
+    def get_group_projects(self, group_id, include_subgroups=False):
+        params = {"include_subgroups": "true"} if include_subgroups else {}
+        return paginate(self, f"groups/{group_id}/projects", params, record_class=ProjectRecord)
 
     # Function to get runners within a group
-    def get_group_runners(self, group_id):
-        url = f"{self.GITLAB_API_URL}groups/{group_id}/runners"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
+    async def get_group_runners(self, group_id):
+        return await self.get_all_pages(paginate(self, f"groups/{group_id}/runners"))
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
-
-    # Function to recursively get subgroups and their projects
+    # Function to get the cached projects of a group and its subgroups
     async def get_subgroup_projects(self, group_id):
-        project_page = 1
-        subgroup_page = 1
-
-        while True:
-            # Fetch and add projects of the current group to self.projects
-            projects = await self.fetch_items_in_executor(self.get_group_projects, group_id, project_page)
-
-            if projects is not None:
-                for project in projects:
-                    project_name = project["path_with_namespace"]
-                    project_id = project["id"]
-                    self.mapping_list[project_id] = group_id
-                    logger.info(f"Project: {project_id} / {project_name}")
-                
-                self.projects.extend(projects)
-                
-                if len(projects) <= 100:
-                    break
-                project_page += 1
-            else:
-                break
-
-        while True:
-            # Fetch and process subgroups
-            subgroups = await self.fetch_items_in_executor(self.get_group_subgroups, group_id, subgroup_page)
-
-            if subgroups is not None:
-                for subgroup in subgroups:
-                    subgroup_path = subgroup["full_path"]
-                    if subgroup_path in self.ignored_subgroup_path_list:
-                        continue
-                    subgroup_id = subgroup["id"]
-                    logger.info(f"Subgroup: {subgroup_path}")
-                    # Recursively call get_subgroup_projects for subgroups
-                    await self.get_subgroup_projects(subgroup_id)
-                if len(subgroups) <= 100:
-                    break
-                subgroup_page += 1
-            else:
-                break
-
-        return self.projects
+        if group_id not in self.topologies:
+            self.topologies[group_id] = GroupTopology(self, group_id, self.mapping_list)
+        return await self.topologies[group_id].get_projects()
 
     # Function to get pipelines within a project
-    def get_projects_pipelines(self, project_id, page):
-        per_page = 100  # show 100 results in a page
-        url = f"{self.GITLAB_API_URL}projects/{project_id}/pipelines?per_page={per_page}&page={page}&order_by=id"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
-            logger.warning(f"Error occurred: {response.status_code}")
-            return None
+    # the traversal usually stops on the first page, so the next page isn't prefetched
+    def get_projects_pipelines(self, project_id):
+        params = {"order_by": "id"}
+        return paginate(
+            self,
+            f"projects/{project_id}/pipelines",
+            params,
+            prefetch=False,
+            record_class=PipelineRecord,
+        )
 
     # Function to get pipelines' details within a project
-    def get_pipeline_details(self, project_id, pipeline_id):
-        url = f"{self.GITLAB_API_URL}projects/{project_id}/pipelines/{pipeline_id}"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
+    async def get_pipeline_details(self, project_id, pipeline_id):
+        return await self.get(
+            f"projects/{project_id}/pipelines/{pipeline_id}", record_class=PipelineRecord
+        )
+
+    # Function to get pipelines within a project which were updated in the time intervals
+    def get_updated_projects_pipelines(self, project_id, start_time, end_time):
+        params = {
+            "order_by": "updated_at",
+            "sort": "desc",
+            "updated_after": format_timestamp(start_time),
+            "updated_before": format_timestamp(end_time),
+        }
+        return paginate(
+            self, f"projects/{project_id}/pipelines", params, record_class=PipelineRecord
+        )
+
+    # Function to fetch pipelines' details concurrently in batches, every batch is yielded once fetched
+    async def get_pipelines_details(self, project_id, pipeline_ids):
+        batch_size = self.pipeline_details_batch_size
+        for index in range(0, len(pipeline_ids), batch_size):
+            batch = pipeline_ids[index : index + batch_size]
+            yield await asyncio.gather(
+                *(
+                    self.fetch_items(self.get_pipeline_details, project_id, pipeline_id)
+                    for pipeline_id in batch
+                )
+            )
+            self.pipeline_details_stats["fetched"] += len(batch)
 
     # Function to select the pipelines within the time intervals
     async def select_pipelines_for_execution(self, projects, start_time, end_time):
-        pipelines_for_all_projects = {}
+        self.pipeline_details_stats = {"listed": 0, "fetched": 0}
+        if self.pipeline_collection_mode == "updated_window":
+            collector = self.select_updated_project_pipelines
+        else:
+            collector = self.select_project_pipelines
+        pipelines_for_all_projects = await self.gather_with_limit(
+            collector, projects, "project", start_time, end_time
+        )
+        self.log_pipeline_details_stats()
+        logger.debug(pipelines_for_all_projects)
+        return pipelines_for_all_projects
+
+    # Function to get the iterator of the pipelines of a project for the collection mode, used by streaming
+    def get_project_pipelines_iterator(self):
+        self.pipeline_details_stats = {"listed": 0, "fetched": 0}
+        if self.pipeline_collection_mode == "updated_window":
+            return self.iter_updated_project_pipelines
+        return self.iter_project_pipelines
+
+    def log_pipeline_details_stats(self):
+        if self.pipeline_collection_mode == "updated_window":
+            listed = self.pipeline_details_stats["listed"]
+            fetched = self.pipeline_details_stats["fetched"]
+            logger.info(
+                f"pipeline details fetched: {fetched}, listed: {listed}, detail calls saved: {listed - fetched}"
+            )
+
+    async def select_updated_project_pipelines(self, project, start_time, end_time):
+        return {
+            pipeline_id: pipeline
+            async for pipeline_id, pipeline in self.iter_updated_project_pipelines(
+                project, start_time, end_time
+            )
+        }
+
+    # Function to iterate over the pipelines of a single project from the pipelines updated in the time intervals,
+    # details are only fetched for pipelines that finished or started in the window
+    async def iter_updated_project_pipelines(self, project, start_time, end_time):
+        project_id = project["id"]
+        project_path = project["path_with_namespace"]
+        logger.info(f"ready to get updated pipelines for project: {project_path}")
+        unfinished_pipelines = self.unfinished_pipelines.setdefault(project_id, InflightTracker())
+        pipeline_ids = list()
+        window_start, window_end = to_epoch_micros(start_time), to_epoch_micros(end_time)
+
+        async for pipelines in self.get_updated_projects_pipelines(project_id, start_time, end_time):
+            # pages are sorted by updated_at, so the window is cut with a binary search
+            for pipeline in slice_window(pipelines, "updated_at", window_start, window_end):
+                self.pipeline_details_stats["listed"] += 1
+                # a tracked pipeline which is still running has been collected already
+                if (
+                    pipeline.id in unfinished_pipelines
+                    and pipeline.status in UNFINISHED_STATUSES
+                ):
+                    continue
+                pipeline_ids.append(pipeline.id)
+
+        async for pipelines in self.get_pipelines_details(project_id, pipeline_ids):
+            for pipeline in pipelines:
+                if pipeline is None:
+                    continue
+                pipeline_id = pipeline.id
+
+                if pipeline.finished_at is None:
+                    if pipeline_id in unfinished_pipelines:
+                        continue
+                    unfinished_pipelines.add(pipeline_id)
+                else:
+                    # keep tracking it, the next window will cover it
+                    if pipeline.finished_at > window_end:
+                        continue
+                    unfinished_pipelines.remove(pipeline_id)
+                    if pipeline.finished_at <= window_start:
+                        continue
+                    self.queue_pipeline_jobs(project, pipeline)
+
+                yield pipeline_id, {
+                    "group_id": self.mapping_list.get(project_id),
+                    "path_with_namespace": project_path,
+                    "source": pipeline.source,
+                    "ref": pipeline.ref,
+                    "pipeline_id": pipeline_id,
+                    "status": pipeline.status,
+                    "duration": pipeline.duration or 0,
+                    "queued_duration": pipeline.queued_duration or 0,
+                    "finished_at": pipeline.finished_at,
+                }
+
+    async def select_project_pipelines(self, project, start_time, end_time):
+        return {
+            pipeline_id: pipeline
+            async for pipeline_id, pipeline in self.iter_project_pipelines(project, start_time, end_time)
+        }
+
+    # Function to iterate over the pipelines of a single project within the time intervals,
+    # the tracked pipelines are updated once the traversal is done
+    async def iter_project_pipelines(self, project, start_time, end_time):
+        project_id = project["id"]
+        project_path = project["path_with_namespace"]
+        logger.info(f"ready to get pipeline for project: {project_path}")
+        unfinished_pipelines = self.unfinished_pipelines.setdefault(project_id, InflightTracker())
+        window_start, window_end = to_epoch_micros(start_time), to_epoch_micros(end_time)
+        traverse_count = 0
+        unfinished_pipeline_length = len(unfinished_pipelines)
+        current_unfinished_pipelines = list()
+        pipelines_to_remove = list()
+
+        logger.info(f"{project_id}: {unfinished_pipeline_length} unfinished pipelines")
+        async for pipelines in self.get_projects_pipelines(project_id):
+            stop = False
+            for pipeline in pipelines:
+                pipeline_id = pipeline.id
+                # every tracked pipeline has been seen, or the page went below the lowest tracked id
+                if stop == True and (
+                    traverse_count == unfinished_pipeline_length
+                    or unfinished_pipelines.below_watermark(pipeline_id)
+                ):
+                    break
+                pipeline = await self.fetch_items(
+                    self.get_pipeline_details, project_id, pipeline_id
+                )
 
-        try:
-            for project in projects:
-                project_id = project["id"]
-                project_path = project["path_with_namespace"]
-                logger.info(f"ready to get pipeline for project: {project_path}")
-                page = 1
-                self.unfinished_pipelines.setdefault(project_id, list())
-                traverse_count = 0
-                unfinished_pipeline_length = len(self.unfinished_pipelines[project_id])
-                current_unfinished_pipelines = list()
-                pipelines_to_remove = list()
-
-                while True:
-                    logger.info(
-                        f"{project_id}: {self.unfinished_pipelines[project_id]}"
-                    )
-                    pipelines = await self.fetch_items_in_executor(
-                        self.get_projects_pipelines, project_id, page
-                    )
-        
-
-                    # if no more pipelines, then break from loop
-                    if not pipelines:
-                        break
-
-                    stop = False
-                    for pipeline in pipelines:
-                        if (
-                            stop == True
-                            and traverse_count == unfinished_pipeline_length
-                        ):
-                            break
-                        pipeline_id = pipeline["id"]
-                        pipeline = await self.fetch_items_in_executor(
-                            self.get_pipeline_details, project_id, pipeline_id
-                        )
-
-                        if pipeline is None:
-                            continue
-
-                        for unfinished_pipeline_id in self.unfinished_pipelines[project_id]:
-                            if pipeline_id == unfinished_pipeline_id:
-                                traverse_count += 1
-                                if pipeline["finished_at"] is not None:
-                                    pipelines_to_remove.append(unfinished_pipeline_id)
-                                    break
-                            elif pipeline_id < unfinished_pipeline_id:
-                                continue
-                            else:
-                                break
-
-                        if pipeline["finished_at"] is None:
-                            if pipeline_id not in self.unfinished_pipelines[project_id]:
-                                current_unfinished_pipelines.append(pipeline_id)
-                                pipeline_attr = {
-                                    "group_id": self.mapping_list.get(project_id),
-                                    "path_with_namespace": project_path,
-                                    "source": pipeline["source"],
-                                    "ref": pipeline["ref"],
-                                    "pipeline_id": pipeline_id,
-                                    "status": pipeline["status"],
-                                    "duration": pipeline["duration"] or 0,
-                                    "queued_duration": pipeline["queued_duration"] or 0,
-                                }
-
-                                pipelines_for_all_projects[pipeline_id] = pipeline_attr
-
-                            continue
-
-                        pipeline_finished_time = datetime.strptime(
-                            pipeline["finished_at"], "%Y-%m-%dT%H:%M:%S.%fZ"
-                        )
-                        if pipeline_finished_time > end_time:
-                            continue
-                        elif pipeline_finished_time <= start_time:
-                            stop = True
-                            continue
+                if pipeline is None:
+                    continue
+
+                if pipeline_id in unfinished_pipelines:
+                    traverse_count += 1
+                    if pipeline.finished_at is not None:
+                        pipelines_to_remove.append(pipeline_id)
 
+                if pipeline.finished_at is None:
+                    if pipeline_id not in unfinished_pipelines:
+                        current_unfinished_pipelines.append(pipeline_id)
                         pipeline_attr = {
                             "group_id": self.mapping_list.get(project_id),
                             "path_with_namespace": project_path,
-                            "source": pipeline["source"],
-                            "ref": pipeline["ref"],
+                            "source": pipeline.source,
+                            "ref": pipeline.ref,
                             "pipeline_id": pipeline_id,
-                            "status": pipeline["status"],
-                            "duration": pipeline["duration"] or 0,
-                            "queued_duration": pipeline["queued_duration"] or 0,
+                            "status": pipeline.status,
+                            "duration": pipeline.duration or 0,
+                            "queued_duration": pipeline.queued_duration or 0,
+                            "finished_at": pipeline.finished_at,
                         }
 
-                        pipelines_for_all_projects[pipeline_id] = pipeline_attr
-
-                    if traverse_count == unfinished_pipeline_length:
-                        break
-
-                    page += 1
-
-                for unfinished_pipeline_id in pipelines_to_remove:
-                    self.unfinished_pipelines[project_id].remove(unfinished_pipeline_id)
-
-                self.unfinished_pipelines[project_id].extend(
-                    current_unfinished_pipelines
-                )
-                self.unfinished_pipelines[project_id].sort(reverse=True)
-
-            logger.info(pipelines_for_all_projects)
-            return pipelines_for_all_projects
+                        yield pipeline_id, pipeline_attr
+
+                    continue
+
+                if pipeline.finished_at > window_end:
+                    continue
+                elif pipeline.finished_at <= window_start:
+                    stop = True
+                    continue
+
+                pipeline_attr = {
+                    "group_id": self.mapping_list.get(project_id),
+                    "path_with_namespace": project_path,
+                    "source": pipeline.source,
+                    "ref": pipeline.ref,
+                    "pipeline_id": pipeline_id,
+                    "status": pipeline.status,
+                    "duration": pipeline.duration or 0,
+                    "queued_duration": pipeline.queued_duration or 0,
+                    "finished_at": pipeline.finished_at,
+                }
+
+                self.queue_pipeline_jobs(project, pipeline)
+                yield pipeline_id, pipeline_attr
+
+            if traverse_count == unfinished_pipeline_length or (
+                unfinished_pipelines.below_watermark(pipelines[-1].id)
+            ):
+                break
 
-        except Exception as e:
-            logger.error(f"Error occurred while getting projects pipelines: {e}")
+        unfinished_pipelines.difference_update(pipelines_to_remove)
+        unfinished_pipelines.update(current_unfinished_pipelines)
 
     # Function to get jobs and jobs' details within a runner in the group
-    def get_runners_jobs(self, runner_id, page):
-        per_page = 100  # show 100 results in a page
-        url = f"{self.GITLAB_API_URL}runners/{runner_id}/jobs?per_page={per_page}&page={page}&order_by=id"
-        response = requests.get(url, headers={"PRIVATE-TOKEN": self.PRIVATE_TOKEN})
+    # the traversal usually stops on the first page, so the next page isn't prefetched
+    def get_runners_jobs(self, runner_id):
+        params = {"order_by": "id"}
+        return paginate(
+            self, f"runners/{runner_id}/jobs", params, prefetch=False, record_class=JobRecord
+        )
+
+    # Function to keep a finished pipeline for the next job cycle in pipelines mode
+    def queue_pipeline_jobs(self, project, pipeline):
+        if self.job_collection_mode == "pipelines":
+            self.pipelines_for_jobs.append(
+                {"id": pipeline.id, "project": project, "source": pipeline.source}
+            )
+
+    # Function to take the pipelines kept for the job cycle so far, with the ones a failed or cancelled
+    # job cycle didn't finish, a pipeline queued again by the retry of a failed pipeline cycle is taken once
+    def take_pipelines_for_jobs(self):
+        pipelines = {pipeline["id"]: pipeline for pipeline in self.pipelines_in_job_cycle}
+        for pipeline in self.pipelines_for_jobs:
+            pipelines.setdefault(pipeline["id"], pipeline)
+        self.pipelines_in_job_cycle = list(pipelines.values())
+        self.pipelines_for_jobs = []
+        self.listed_pipeline_jobs = {}
+        return list(self.pipelines_in_job_cycle)
+
+    # Function to mark the jobs of the listed pipelines collected once their metrics are, the pipelines
+    # whose jobs couldn't be listed stay for the next job cycle
+    def finish_pipeline_jobs(self):
+        for job_ids in self.listed_pipeline_jobs.values():
+            for job_id in job_ids:
+                self.collected_job_ids.first_seen(job_id)
+        self.pipelines_in_job_cycle = [
+            pipeline
+            for pipeline in self.pipelines_in_job_cycle
+            if pipeline["id"] not in self.listed_pipeline_jobs
+        ]
+        self.listed_pipeline_jobs = {}
+        if self.pipelines_in_job_cycle:
+            logger.warning(f"{len(self.pipelines_in_job_cycle)} pipelines kept for the next job cycle")
+
+    # Function to get the jobs of a pipeline
+    async def get_pipeline_jobs(self, project_id, pipeline_id):
+        return await self.get_all_pages(
+            paginate(
+                self, f"projects/{project_id}/pipelines/{pipeline_id}/jobs", record_class=JobRecord
+            )
+        )
+
+    # Function to collect the jobs of the pipelines finished since the last job cycle, every job has finished
+    # with its pipeline so only the pipelines of an unfinished job cycle are tracked between cycles
+    async def select_pipeline_jobs_for_execution(self):
+        jobs_for_all_pipelines = await self.gather_with_limit(
+            self.select_pipeline_jobs, self.take_pipelines_for_jobs(), "pipeline"
+        )
+        logger.debug(jobs_for_all_pipelines)
+        return jobs_for_all_pipelines
+
+    async def select_pipeline_jobs(self, pipeline):
+        return {job_id: job async for job_id, job in self.iter_pipeline_jobs(pipeline)}
+
+    # Function to turn the jobs of a single pipeline into job records, jobs which never got a runner
+    # (skipped, manual, canceled before they started) and jobs already collected are left out
+    async def iter_pipeline_jobs(self, pipeline):
+        project = pipeline["project"]
+        jobs = await self.get_pipeline_jobs(project["id"], pipeline["id"])
+        job_ids = []
+        for job in jobs:
+            if job.runner_description is None or job.id in self.collected_job_ids:
+                continue
+            job_ids.append(job.id)
+            yield job.id, {
+                "group_id": self.mapping_list.get(project["id"]),
+                "runner_description": job.runner_description,
+                "job_id": job.id,
+                "job_name": job.name,
+                "ref": job.ref,
+                "status": job.status,
+                "source": job.source or pipeline["source"],
+                "pipeline_id": pipeline["id"],
+                "path_with_namespace": project["path_with_namespace"],
+                "duration": job.duration or 0,
+                "queued_duration": job.queued_duration or 0,
+                "finished_at": job.finished_at,
+            }
+        self.listed_pipeline_jobs[pipeline["id"]] = job_ids
+
+    # Function to determine which jobs of the runners should collect in current execution
+    async def select_jobs_for_execution(self, runners, start_time, end_time):
+        jobs_for_all_runners = await self.gather_with_limit(
+            self.select_runner_jobs, runners, "runner", start_time, end_time
+        )
+        logger.debug(jobs_for_all_runners)
+        return jobs_for_all_runners
+
+    async def select_runner_jobs(self, runner, start_time, end_time):
+        return {
+            job_id: job async for job_id, job in self.iter_runner_jobs(runner, start_time, end_time)
+        }
+
+    # Function to iterate over the jobs of a single runner which should be collected in current execution,
+    # the tracked jobs are updated once the traversal is done
+    async def iter_runner_jobs(self, runner, start_time, end_time):
+        runner_id = runner["id"]
+        logger.info(f"ready to get jobs for runner: {runner_id}")
+        unfinished_jobs = self.unfinished_jobs.setdefault(runner_id, InflightTracker())
+        window_start, window_end = to_epoch_micros(start_time), to_epoch_micros(end_time)
+        traverse_count = 0
+        unfinished_job_length = len(unfinished_jobs)
+        current_unfinished_jobs = list()
+        jobs_to_remove = list()
+        logger.info(f"{runner_id}: {unfinished_job_length} unfinished jobs")
+        async for jobs in self.get_runners_jobs(runner_id):
+            stop = False
+
+            for job in jobs:
+                job_id = job.id
+                # every tracked job has been seen, or the page went below the lowest tracked id
+                if stop == True and (
+                    traverse_count == unfinished_job_length
+                    or unfinished_jobs.below_watermark(job_id)
+                ):
+                    break
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
-            logger.warning(f"Error occurred: {response.status_code}")
-            return None
+                job_finished_at = job.finished_at
 
-    # Function to determine which jobs should collect in current execution
-    async def select_jobs_for_execution(self, group_id, start_time, end_time):
-        jobs_for_all_runners = {}
+                if job_id in unfinished_jobs:
+                    traverse_count += 1
+                    if job_finished_at is not None:
+                        jobs_to_remove.append(job_id)
 
-        try:
-            runners = await self.fetch_items_in_executor(self.get_group_runners, group_id)
-            for runner in runners:
-                runner_id = runner["id"]
-                logger.info(f"ready to get jobs for runner: {runner_id}")
-                page = 1
-                self.unfinished_jobs.setdefault(runner_id, list())
-                traverse_count = 0
-                unfinished_job_length = len(self.unfinished_jobs[runner_id])
-                current_unfinished_jobs = list()
-                jobs_to_remove = list()
-                while True:
-                    logger.info(f"{runner_id}: {self.unfinished_jobs[runner_id]}")
-                    jobs = await self.fetch_items_in_executor(
-                        self.get_runners_jobs, runner_id, page
-                    )  
-        
-                    # if no more job, then break from while loop
-                    if not jobs:
-                        break
-
-                    stop = False
-
-                    for job in jobs:
-                        if stop == True and traverse_count == unfinished_job_length:
-                            break
-
-                        job_id = job["id"]
-                        job_finished_at = job["finished_at"]
-
-                        for unfinished_job_id in self.unfinished_jobs[runner_id]:
-                            if job_id > unfinished_job_id:
-                                break
-                            elif job_id < unfinished_job_id:
-                                continue
-                            else:
-                                traverse_count += 1
-                                if job_finished_at is not None:
-                                    jobs_to_remove.append(unfinished_job_id)
-                                    break
-
-                        if job_finished_at is None:
-                            if job_id not in self.unfinished_jobs[runner_id]:
-                                current_unfinished_jobs.append(job_id)
-
-                                job_attr = {
-                                    "group_id": self.mapping_list.get(job["project"]["id"]),
-                                    "runner_description": runner["description"],
-                                    "job_id": job_id,
-                                    "job_name": job["name"],
-                                    "ref": job["ref"],
-                                    "status": job["status"],
-                                    "source": job['pipeline']['source'],
-                                    "pipeline_id": job["pipeline"]["id"],
-                                    "path_with_namespace": job["project"]["path_with_namespace"],
-                                    "duration": job["duration"] or 0,
-                                    "queued_duration": job["queued_duration"] or 0,
-                                }
-
-                                jobs_for_all_runners[job_id] = job_attr
-
-                            continue
-
-                        job_finished_at = datetime.strptime(
-                            job["finished_at"], "%Y-%m-%dT%H:%M:%S.%fZ"
-                        )
-
-                        if job_finished_at > end_time:
-                            continue
-                        elif job_finished_at <= start_time:
-                            stop = True
-                            continue
+                if job_finished_at is None:
+                    if job_id not in unfinished_jobs:
+                        current_unfinished_jobs.append(job_id)
 
                         job_attr = {
-                            "group_id": self.mapping_list.get(job["project"]["id"]),
+                            "group_id": self.mapping_list.get(job.project_id),
                             "runner_description": runner["description"],
-                            "job_id": job["id"],
-                            "job_name": job["name"],
-                            "ref": job["ref"],
-                            "status": job["status"],
-                            "source": job['pipeline']['source'],
-                            "pipeline_id": job["pipeline"]["id"],
-                            "path_with_namespace": job["project"]["path_with_namespace"],
-                            "duration": job["duration"] or 0,
-                            "queued_duration": job["queued_duration"] or 0,
+                            "job_id": job_id,
+                            "job_name": job.name,
+                            "ref": job.ref,
+                            "status": job.status,
+                            "source": job.source,
+                            "pipeline_id": job.pipeline_id,
+                            "path_with_namespace": job.path_with_namespace,
+                            "duration": job.duration or 0,
+                            "queued_duration": job.queued_duration or 0,
+                            "finished_at": job.finished_at,
                         }
 
-                        jobs_for_all_runners[job_id] = job_attr
-
-                    if traverse_count == unfinished_job_length:
-                        break
-
-                    page += 1
-
-                for job_id in jobs_to_remove:
-                    self.unfinished_jobs[runner_id].remove(job_id)
-
-                self.unfinished_jobs[runner_id].extend(current_unfinished_jobs)
-                self.unfinished_jobs[runner_id].sort(reverse=True)
-
-            logger.info(jobs_for_all_runners)
-            return jobs_for_all_runners
+                        yield job_id, job_attr
+
+                    continue
+
+                if job_finished_at > window_end:
+                    continue
+                elif job_finished_at <= window_start:
+                    stop = True
+                    continue
+
+                job_attr = {
+                    "group_id": self.mapping_list.get(job.project_id),
+                    "runner_description": runner["description"],
+                    "job_id": job.id,
+                    "job_name": job.name,
+                    "ref": job.ref,
+                    "status": job.status,
+                    "source": job.source,
+                    "pipeline_id": job.pipeline_id,
+                    "path_with_namespace": job.path_with_namespace,
+                    "duration": job.duration or 0,
+                    "queued_duration": job.queued_duration or 0,
+                    "finished_at": job.finished_at,
+                }
+
+                yield job_id, job_attr
+
+            if traverse_count == unfinished_job_length or (
+                unfinished_jobs.below_watermark(jobs[-1].id)
+            ):
+                break
 
-        except Exception as e:
-            logger.error(f"Error occurred while getting runners jobs: {e}")
+        unfinished_jobs.difference_update(jobs_to_remove)
+        unfinished_jobs.update(current_unfinished_jobs)
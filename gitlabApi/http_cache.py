@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from urllib.parse import urlencode
+from gitlabApi.records import decode
+from prometheus.self_metrics import http_cache_bytes, http_cache_evictions, http_cache_responses
+
+logger = logging.getLogger(__name__)
+
+# headers of a cached response handed back with its body on a 304, the pagination reads them
+REPLAYED_HEADERS = ("Link", "X-Next-Page", "X-Page", "X-Per-Page", "X-Total", "X-Total-Pages")
+
+
+class CachedResponse:
+    __slots__ = ("etag", "last_modified", "headers", "body", "size")
+
+    # body is None for a response found on disk until it's decoded
+    def __init__(self, etag, last_modified, headers, body, size):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.body = body
+        self.size = size
+
+    # Function to get the headers making a request conditional on the cached validators
+    def conditions(self):
+        conditions = {}
+        if self.etag:
+            conditions["If-None-Match"] = self.etag
+        if self.last_modified:
+            conditions["If-Modified-Since"] = self.last_modified
+        return conditions
+
+
+# LRU cache of GitLab API responses carrying an ETag or Last-Modified, the decoded body is kept so a request
+# answered with 304 Not Modified is neither transferred nor parsed again, responses are read-only once decoded
+# so they're shared between cycles, with a directory the bodies survive restarts, the files are read and
+# written by worker threads so the loop never waits for the disk
+class ResponseCache:
+    def __init__(self):
+        self.enabled = os.environ.get("HTTP_CACHE_ENABLED", "true").lower() == "true"
+        self.max_entries = int(os.environ.get("HTTP_CACHE_MAX_ENTRIES", 10000))
+        # measured as the size of the response bodies
+        self.max_bytes = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        self.directory = os.environ.get("HTTP_CACHE_DIR", "")
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # key -> (entry, raw body) to write, or None to remove the file, coalesced until the writer takes them
+        self.pending_writes = {}
+        self.writer_task = None
+
+    # Function to build the cache key of a request, the same url decoded into another record class is another entry
+    @staticmethod
+    def key(path, params=None, record_class=None):
+        query = urlencode(sorted(params.items())) if params else ""
+        record_type = record_class.__name__ if record_class is not None else "json"
+        return f"{record_type} {path}?{query}"
+
+    def file_path(self, key):
+        return os.path.join(self.directory, f"{hashlib.sha1(key.encode()).hexdigest()}.response")
+
+    # Function to index the responses kept on disk by a previous run in a worker thread, called at startup,
+    # the bodies are only read when they're first used
+    async def load(self):
+        if not self.enabled or not self.directory:
+            return
+        loop = asyncio.get_running_loop()
+        for key, entry in await loop.run_in_executor(None, self.read_index):
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.total_bytes += entry.size
+        self.evict()
+        if self.entries:
+            logger.info(f"{len(self.entries)} cached API responses loaded from {self.directory}")
+
+    # Function to read the headers of the responses on disk, least recently written first,
+    # the disk cache is disabled when the volume isn't mounted
+    def read_index(self):
+        if not os.path.isdir(os.path.dirname(self.directory.rstrip("/")) or "."):
+            logger.warning(f"Parent directory of {self.directory} doesn't exist, API responses cached in memory only")
+            self.directory = ""
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        paths = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".response")
+        ]
+        index = []
+        for path in sorted(paths, key=os.path.getmtime):
+            try:
+                with open(path, "rb") as response_file:
+                    header = json.loads(response_file.readline())
+                entry = CachedResponse(
+                    header["etag"], header["last_modified"], header["headers"], None, os.path.getsize(path)
+                )
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable cached response {path}: {e}")
+                self.remove_file(path)
+                continue
+            index.append((header["key"], entry))
+        return index
+
+    # Function to get the cached response of a request, a response from disk is read and decoded in a worker
+    # thread on first use
+    async def lookup(self, key, record_class=None):
+        if not self.enabled:
+            return None
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.body is None:
+            loop = asyncio.get_running_loop()
+            try:
+                body = await loop.run_in_executor(None, self.read_file, key, entry, record_class)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable cached response of {key}: {e}")
+                if self.entries.get(key) is entry:
+                    self.remove(key)
+                return None
+            # the response was replaced while its file was read
+            if body is None:
+                return None
+            entry.body = body
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        return entry
+
+    # Function to decode the body of a response on disk, None when the file holds another response
+    def read_file(self, key, entry, record_class):
+        with open(self.file_path(key), "rb") as response_file:
+            header = json.loads(response_file.readline())
+            if header["etag"] != entry.etag or header["last_modified"] != entry.last_modified:
+                return None
+            return decode(response_file.read(), record_class)
+
+    # Function to count a 304 answered from the cache
+    def hit(self, endpoint):
+        http_cache_responses.labels(endpoint=endpoint, result="hit").inc()
+
+    # Function to cache a 200 response which carries validators, a response without them replaces nothing
+    def store(self, key, endpoint, headers, raw_body, body):
+        if not self.enabled:
+            return
+        cached = key in self.entries
+        http_cache_responses.labels(endpoint=endpoint, result="changed" if cached else "miss").inc()
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if (not etag and not last_modified) or "no-store" in headers.get("Cache-Control", ""):
+            if cached:
+                self.remove(key)
+            return
+        if len(raw_body) > self.max_bytes:
+            return
+        if cached:
+            self.remove(key)
+        replayed = {name: headers[name] for name in REPLAYED_HEADERS if name in headers}
+        entry = CachedResponse(etag, last_modified, replayed, body, len(raw_body))
+        if self.directory:
+            self.queue_write(key, (entry, raw_body))
+        self.entries[key] = entry
+        self.total_bytes += entry.size
+        self.evict()
+
+    # Function to queue the write of a response file, or its removal with None, writes queued while others are
+    # being written are coalesced, only the last one of a key is written
+    def queue_write(self, key, write):
+        self.pending_writes[key] = write
+        if self.writer_task is None or self.writer_task.done():
+            self.writer_task = asyncio.create_task(self.write_pending())
+
+    # Function to write the queued response files in a worker thread until nothing is pending
+    async def write_pending(self):
+        loop = asyncio.get_running_loop()
+        while self.pending_writes:
+            writes = self.pending_writes
+            self.pending_writes = {}
+            await loop.run_in_executor(None, self.write_files, writes)
+
+    def write_files(self, writes):
+        for key, write in writes.items():
+            try:
+                if write is None:
+                    self.remove_file(self.file_path(key))
+                else:
+                    self.write_file(key, *write)
+            except OSError as e:
+                logger.warning(f"Error occurred while writing cached response of {key}: {e}")
+
+    # Function to wait for the queued files to be written, used on shutdown
+    async def flush(self):
+        if self.writer_task is not None:
+            await self.writer_task
+
+    def write_file(self, key, entry, raw_body):
+        header = json.dumps(
+            {
+                "key": key,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+                "headers": entry.headers,
+            }
+        )
+        with open(self.file_path(key), "wb") as response_file:
+            response_file.write(header.encode() + b"\n" + raw_body)
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+        if self.directory:
+            self.queue_write(key, None)
+        http_cache_bytes.set(self.total_bytes)
+
+    # Function to drop the least recently used responses until the cache is within its limits
+    def evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+            http_cache_evictions.inc()
+        http_cache_bytes.set(self.total_bytes)
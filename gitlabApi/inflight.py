@@ -0,0 +1,49 @@
+class InflightTracker:
+    def __init__(self, item_ids=()):
+        # hash set for O(1) membership, add and remove
+        self.item_ids = set(item_ids)
+        self._min_id = None
+        self._min_id_dirty = True
+
+    def __contains__(self, item_id):
+        return item_id in self.item_ids
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __iter__(self):
+        return iter(self.item_ids)
+
+    def __repr__(self):
+        return f"InflightTracker({sorted(self.item_ids, reverse=True)})"
+
+    # Lowest tracked id, ids below it can't match anything in the tracker
+    @property
+    def min_id(self):
+        if self._min_id_dirty:
+            self._min_id = min(self.item_ids) if self.item_ids else None
+            self._min_id_dirty = False
+        return self._min_id
+
+    def add(self, item_id):
+        self.item_ids.add(item_id)
+        if not self._min_id_dirty and (self._min_id is None or item_id < self._min_id):
+            self._min_id = item_id
+
+    def remove(self, item_id):
+        self.item_ids.discard(item_id)
+        if item_id == self._min_id:
+            self._min_id_dirty = True
+
+    def update(self, item_ids):
+        for item_id in item_ids:
+            self.add(item_id)
+
+    def difference_update(self, item_ids):
+        for item_id in item_ids:
+            self.remove(item_id)
+
+    # Function to check whether a traversal ordered by id descending has passed every tracked id
+    def below_watermark(self, item_id):
+        min_id = self.min_id
+        return min_id is not None and item_id < min_id
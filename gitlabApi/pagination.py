@@ -0,0 +1,65 @@
+import asyncio
+import re
+from gitlabApi.retry import endpoint_template
+from prometheus.self_metrics import pages_fetched
+
+# list endpoints which support pagination=keyset, keyed by endpoint template
+KEYSET_PAGINATED_ENDPOINTS = {"projects", "projects/:id/jobs"}
+LINK_NEXT_PATTERN = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+
+# Function to find the request of the next page from the Link / X-Next-Page headers,
+# falls back to the page size when GitLab doesn't send pagination headers
+def get_next_page(path, params, headers, item_count, per_page):
+    link_header = headers.get("Link")
+    if link_header:
+        match = LINK_NEXT_PATTERN.search(link_header)
+        if match:
+            return match.group(1), None
+    # a request built from a Link url carries its own query
+    if params is None:
+        return None, None
+    if "X-Next-Page" in headers:
+        next_page = headers["X-Next-Page"]
+        if not next_page:
+            return None, None
+        return path, dict(params, page=int(next_page))
+    if link_header or item_count < per_page or params.get("pagination") == "keyset":
+        return None, None
+    return path, dict(params, page=params.get("page", 1) + 1)
+
+
+# Async generator yielding every page of a GitLab list endpoint, the next page is requested
+# while the current one is processed unless prefetch is off for callers which stop early
+async def paginate(
+    gitlab_api_interaction, path, params=None, per_page=100, prefetch=True, record_class=None
+):
+    params = dict(params or {}, per_page=per_page)
+    if endpoint_template(path) in KEYSET_PAGINATED_ENDPOINTS:
+        params.setdefault("pagination", "keyset")
+        params.setdefault("order_by", "id")
+        params.setdefault("sort", "desc")
+    else:
+        params.setdefault("page", 1)
+
+    next_request = asyncio.ensure_future(gitlab_api_interaction.get_page(path, params, record_class))
+    try:
+        while next_request is not None:
+            items, headers = await next_request
+            next_request = None
+            if not items:
+                return
+            pages_fetched.labels(endpoint=endpoint_template(path)).inc()
+            next_path, next_params = get_next_page(path, params, headers, len(items), per_page)
+            if next_path is not None:
+                path, params = next_path, next_params
+                if prefetch:
+                    next_request = asyncio.ensure_future(gitlab_api_interaction.get_page(path, params, record_class))
+            yield items
+            if next_path is None:
+                return
+            if next_request is None:
+                next_request = asyncio.ensure_future(gitlab_api_interaction.get_page(path, params, record_class))
+    finally:
+        if next_request is not None and not next_request.done():
+            next_request.cancel()
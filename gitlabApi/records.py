@@ -0,0 +1,95 @@
+import json
+from gitlabApi.timestamps import parse_timestamp
+
+# orjson is optional, it decodes pages several times faster than the json module
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+# Compact records of the GitLab API objects the exporter reads, built from a decoded item and keeping only
+# the fields in use so the rest of the page (commit, user, artifacts, ...) is freed as soon as it's parsed,
+# timestamps are kept as epoch microseconds
+
+
+class ProjectRecord:
+    __slots__ = ("id", "path_with_namespace", "namespace_id", "namespace_full_path")
+
+    def __init__(self, item):
+        namespace = item["namespace"]
+        self.id = item["id"]
+        self.path_with_namespace = item["path_with_namespace"]
+        self.namespace_id = namespace["id"]
+        self.namespace_full_path = namespace["full_path"]
+
+
+class PipelineRecord:
+    __slots__ = (
+        "id",
+        "status",
+        "ref",
+        "source",
+        "updated_at",
+        "finished_at",
+        "duration",
+        "queued_duration",
+    )
+
+    def __init__(self, item):
+        self.id = item["id"]
+        self.status = item.get("status")
+        self.ref = item.get("ref")
+        self.source = item.get("source")
+        self.updated_at = parse_timestamp(item.get("updated_at"))
+        # only pipeline details carry the timings
+        self.finished_at = parse_timestamp(item.get("finished_at"))
+        self.duration = item.get("duration")
+        self.queued_duration = item.get("queued_duration")
+
+
+class JobRecord:
+    __slots__ = (
+        "id",
+        "name",
+        "ref",
+        "status",
+        "finished_at",
+        "duration",
+        "queued_duration",
+        "pipeline_id",
+        "source",
+        "project_id",
+        "path_with_namespace",
+        "runner_description",
+    )
+
+    # the jobs of a pipeline come without the project's path, the caller knows it
+    def __init__(self, item):
+        pipeline = item["pipeline"]
+        project = item.get("project") or {}
+        runner = item.get("runner") or {}
+        self.id = item["id"]
+        self.name = item["name"]
+        self.ref = item["ref"]
+        self.status = item["status"]
+        self.finished_at = parse_timestamp(item["finished_at"])
+        self.duration = item["duration"]
+        self.queued_duration = item["queued_duration"]
+        self.pipeline_id = pipeline["id"]
+        self.source = pipeline.get("source")
+        self.project_id = project.get("id", pipeline.get("project_id"))
+        self.path_with_namespace = project.get("path_with_namespace")
+        self.runner_description = runner.get("description")
+
+
+# Function to decode a response body, list pages and single objects are turned into records of the given class
+def decode(body, record_class=None):
+    items = loads(body)
+    if record_class is None:
+        return items
+    if isinstance(items, list):
+        return [record_class(item) for item in items]
+    return record_class(items)
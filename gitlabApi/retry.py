@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import re
+import time
+import aiohttp
+from prometheus_client import Counter, Gauge
+from prometheus.self_metrics import SELF_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+request_retries = Counter(
+    "gitlab_exporter_request_retries",
+    "GitLab API requests sent again after a retryable failure",
+    ["endpoint", "reason"],
+    registry=SELF_REGISTRY,
+)
+request_giveups = Counter(
+    "gitlab_exporter_request_giveups",
+    "GitLab API requests abandoned after retries, budget or an open circuit",
+    ["endpoint", "reason"],
+    registry=SELF_REGISTRY,
+)
+circuit_breaker_open = Gauge(
+    "gitlab_exporter_circuit_breaker_open",
+    "Whether requests to the GitLab API endpoint are short-circuited",
+    ["endpoint"],
+    registry=SELF_REGISTRY,
+)
+
+# retry budget of the cycle running in the current task, child tasks inherit it
+current_budget = contextvars.ContextVar("current_budget", default=None)
+
+
+# Raised when the policy gives up on a request, retries exhausted, retry budget used up or circuit open,
+# the cycle fails with it so its window is fetched again
+class GiveUpError(Exception):
+    pass
+
+
+class CircuitOpenError(GiveUpError):
+    pass
+
+
+# Function to turn a request path into its endpoint template, e.g. projects/:id/pipelines
+def endpoint_template(path):
+    return re.sub(r"(?<=/)\d+(?=/|$)", ":id", path.split("?")[0])
+
+
+class RetryBudget:
+    def __init__(self, max_retries):
+        self.remaining = max_retries
+
+    def consume(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint, threshold, cooldown):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    # Function to check whether a request may be sent, a single trial goes through once the cooldown passed
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.cooldown or self.trial_in_flight:
+            return False
+        self.trial_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit of {self.endpoint} closed")
+            circuit_breaker_open.labels(endpoint=self.endpoint).set(0)
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit of {self.endpoint} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            circuit_breaker_open.labels(endpoint=self.endpoint).set(1)
+
+
+class RetryPolicy:
+    def __init__(self, token_count=1):
+        self.base_delay = float(os.environ.get("RETRY_BASE_DELAY_SECONDS", 0.5))
+        self.max_delay = float(os.environ.get("RETRY_MAX_DELAY_SECONDS", 30))
+        # attempts allowed per failure reason, 401 gets one attempt per token
+        self.max_attempts = {
+            "server_error": int(os.environ.get("RETRY_SERVER_ERROR_ATTEMPTS", 3)),
+            "rate_limited": int(os.environ.get("RETRY_RATE_LIMITED_ATTEMPTS", 5)),
+            "connection": int(os.environ.get("RETRY_CONNECTION_ATTEMPTS", 3)),
+            "unauthorized": token_count,
+        }
+        self.budget_per_cycle = int(os.environ.get("RETRY_BUDGET_PER_CYCLE", 200))
+        self.breaker_threshold = int(os.environ.get("CIRCUIT_BREAKER_THRESHOLD", 5))
+        self.breaker_cooldown = float(os.environ.get("CIRCUIT_BREAKER_COOLDOWN_SECONDS", 30))
+        self.breakers = {}
+
+    # Function to give the calling cycle, and every task it spawns, a fresh retry budget
+    def start_cycle(self):
+        current_budget.set(RetryBudget(self.budget_per_cycle))
+
+    # Function to classify a failure, None means it isn't worth retrying
+    def classify(self, error):
+        if isinstance(error, aiohttp.ClientResponseError):
+            if error.status == 429:
+                return "rate_limited"
+            if error.status == 401:
+                return "unauthorized"
+            if error.status >= 500:
+                return "server_error"
+            return None
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)):
+            return "connection"
+        return None
+
+    # Exponential backoff with full jitter, 429s don't wait here since the token pool does it per token
+    def get_delay(self, reason, attempt):
+        if reason in ("rate_limited", "unauthorized"):
+            return 0
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    # Function to run one request under the endpoint's circuit breaker and retry it on retryable failures
+    async def call(self, path, function, *args):
+        endpoint = endpoint_template(path)
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(
+                endpoint, self.breaker_threshold, self.breaker_cooldown
+            )
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                request_giveups.labels(endpoint=endpoint, reason="circuit_open").inc()
+                raise CircuitOpenError(f"Circuit of {endpoint} is open")
+            try:
+                result = await function(*args)
+            except Exception as e:
+                reason = self.classify(e)
+                if reason in ("server_error", "connection"):
+                    breaker.record_failure()
+                elif breaker.trial_in_flight:
+                    breaker.trial_in_flight = False
+                if reason is None:
+                    raise
+
+                attempt += 1
+                budget = current_budget.get()
+                if attempt >= self.max_attempts[reason]:
+                    request_giveups.labels(endpoint=endpoint, reason=reason).inc()
+                    raise GiveUpError(f"Gave up on {path} after {attempt} attempts: {e}") from e
+                if budget is not None and not budget.consume():
+                    request_giveups.labels(endpoint=endpoint, reason="budget_exhausted").inc()
+                    raise GiveUpError(f"Retry budget of the cycle exhausted on {path}: {e}") from e
+                request_retries.labels(endpoint=endpoint, reason=reason).inc()
+                delay = self.get_delay(reason, attempt)
+                logger.warning(f"Retrying {path} in {delay:.2f}s after {reason}: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_success()
+            return result
@@ -0,0 +1,39 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+# Function to convert a datetime into epoch microseconds, naive datetimes are taken as UTC
+def to_epoch_micros(moment):
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH) // MICROSECOND
+
+
+# Function to parse a GitLab timestamp into epoch microseconds, with or without fractional seconds and
+# with a Z or a numeric offset, None stays None
+def parse_timestamp(value):
+    if value is None:
+        return None
+    return to_epoch_micros(datetime.fromisoformat(value))
+
+
+# Function to format a window boundary the way GitLab's updated_after/updated_before expect it
+def format_timestamp(moment):
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# Function to cut the items of a page sorted by the attribute in descending order down to the window
+# [start, end] with two binary searches instead of comparing every item
+def slice_window(items, attribute, start, end):
+    first = bisect_left(items, -end, key=lambda item: -getattr(item, attribute))
+    last = bisect_right(items, -start, lo=first, key=lambda item: -getattr(item, attribute))
+    return items[first:last]
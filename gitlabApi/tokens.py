@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from prometheus_client import Counter, Gauge
+from prometheus.self_metrics import SELF_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+token_rate_limit_remaining = Gauge(
+    "gitlab_exporter_token_rate_limit_remaining",
+    "Remaining GitLab API requests of the token in the current rate limit window",
+    ["token_index"],
+    registry=SELF_REGISTRY,
+)
+token_rate_limit_utilization = Gauge(
+    "gitlab_exporter_token_rate_limit_utilization",
+    "Used fraction of the token's GitLab API rate limit",
+    ["token_index"],
+    registry=SELF_REGISTRY,
+)
+token_requests = Counter(
+    "gitlab_exporter_token_requests",
+    "GitLab API requests sent with the token",
+    ["token_index"],
+    registry=SELF_REGISTRY,
+)
+token_throttled = Counter(
+    "gitlab_exporter_token_throttled",
+    "GitLab API requests of the token rejected with 429",
+    ["token_index"],
+    registry=SELF_REGISTRY,
+)
+
+
+class TokenState:
+    def __init__(self, token, index):
+        self.token = token
+        self.index = str(index)
+        # None until GitLab tells us the rate limit of the token
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.backoff_until = 0
+        self.throttle_count = 0
+        self.disabled = False
+
+    # Function to restore the quota once GitLab's rate limit window has been reset
+    def refresh(self, now):
+        if self.reset_at is not None and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = None
+
+    # Requests the token can still send before it hits the rate limit, unknown quota goes first
+    def headroom(self):
+        if self.remaining is None:
+            return float("inf")
+        return self.remaining
+
+
+class TokenPool:
+    def __init__(self, tokens):
+        self.tokens = [
+            TokenState(token, index) for index, token in enumerate(tokens) if token
+        ]
+        self.by_token = {state.token: state for state in self.tokens}
+        if not self.tokens:
+            raise Exception("PRIVATE_ACCESS_TOKEN doesn't contain any token")
+
+    def __len__(self):
+        return len(self.tokens)
+
+    # Function to pick the token with the most headroom, waits without blocking the loop while all back off
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            available = [state for state in self.tokens if not state.disabled]
+            if not available:
+                logger.error("All tokens are unavailable")
+                raise Exception("All tokens are unavailable")
+
+            for state in available:
+                state.refresh(now)
+            ready = [state for state in available if state.backoff_until <= now]
+            if ready:
+                state = max(ready, key=lambda state: state.headroom())
+                if state.remaining is not None:
+                    # reserve one request until the response brings the real value
+                    state.remaining = max(state.remaining - 1, 0)
+                token_requests.labels(token_index=state.index).inc()
+                return state.token
+
+            wait = min(state.backoff_until for state in available) - now
+            logger.warning(f"All tokens are backing off, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    # Function to update a token's quota from GitLab's RateLimit-* and Retry-After response headers
+    def update(self, token, status, headers):
+        state = self.by_token.get(token)
+        if state is None:
+            return
+        now = time.monotonic()
+
+        if "RateLimit-Limit" in headers:
+            state.limit = int(headers["RateLimit-Limit"])
+        if "RateLimit-Remaining" in headers:
+            state.remaining = int(headers["RateLimit-Remaining"])
+        if "RateLimit-Reset" in headers:
+            state.reset_at = now + max(float(headers["RateLimit-Reset"]) - time.time(), 0)
+
+        if status == 401:
+            logger.error(f"Token {state.index} is unauthorized, removed from the pool")
+            state.disabled = True
+        elif status == 429:
+            state.throttle_count += 1
+            token_throttled.labels(token_index=state.index).inc()
+            if "Retry-After" in headers:
+                backoff = float(headers["Retry-After"])
+            elif state.reset_at is not None:
+                backoff = state.reset_at - now
+            else:
+                backoff = min(2 ** state.throttle_count, 60)
+            state.backoff_until = now + backoff
+            logger.warning(f"Token {state.index} is rate limited, backing off {backoff:.2f}s")
+        else:
+            state.throttle_count = 0
+            if state.remaining == 0 and state.reset_at is not None:
+                state.backoff_until = state.reset_at
+
+        if state.remaining is not None:
+            token_rate_limit_remaining.labels(token_index=state.index).set(state.remaining)
+            if state.limit:
+                token_rate_limit_utilization.labels(token_index=state.index).set(
+                    1 - state.remaining / state.limit
+                )
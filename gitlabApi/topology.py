@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+from prometheus.self_metrics import time_phase
+
+logger = logging.getLogger(__name__)
+
+
+class GroupTopology:
+    def __init__(self, gitlab_api_interaction, group_id, mapping_list):
+        self.gitlab_api_interaction = gitlab_api_interaction
+        self.group_id = group_id
+        # project_id -> group_id index shared with the gitlab class, updated in place on refresh
+        self.mapping_list = mapping_list
+        self.ttl = float(os.environ.get("TOPOLOGY_TTL_SECONDS", 3600))
+        self.include_subgroups = (
+            os.environ.get("TOPOLOGY_INCLUDE_SUBGROUPS", "true").lower() == "true"
+        )
+        self.projects = {}
+        self.subgroups = {}
+        self.refreshed_at = None
+        self.refresh_task = None
+
+    # Function to get the cached projects, the first call blocks and later stale calls refresh in background
+    async def get_projects(self):
+        if self.refreshed_at is None:
+            await self.refresh()
+        elif time.monotonic() - self.refreshed_at > self.ttl:
+            if self.refresh_task is None or self.refresh_task.done():
+                self.refresh_task = asyncio.create_task(self.refresh())
+        return list(self.projects.values())
+
+    # Function to crawl the group tree again and swap it into the cache
+    async def refresh(self):
+        started_at = time.monotonic()
+        try:
+            with time_phase("topology"):
+                if self.include_subgroups:
+                    projects, subgroups = await self.crawl_with_include_subgroups()
+                else:
+                    projects, subgroups = await self.crawl_breadth_first()
+        except Exception as e:
+            logger.error(f"Error occurred while refreshing topology of group {self.group_id}: {e}")
+            if self.refreshed_at is None:
+                raise
+            return
+
+        for project_id in self.projects.keys() - projects.keys():
+            self.mapping_list.pop(project_id, None)
+        for project_id, project in projects.items():
+            self.mapping_list[project_id] = project["group_id"]
+        self.projects = projects
+        self.subgroups = subgroups
+        self.refreshed_at = time.monotonic()
+        logger.info(
+            f"Topology of group {self.group_id} refreshed: {len(projects)} projects, "
+            f"{len(subgroups)} subgroups in {self.refreshed_at - started_at:.2f}s"
+        )
+
+    # Function to check whether a namespace is an ignored subgroup or nested under one
+    def is_ignored(self, full_path):
+        for ignored_path in self.gitlab_api_interaction.ignored_subgroup_path_list:
+            if ignored_path and (full_path == ignored_path or full_path.startswith(f"{ignored_path}/")):
+                return True
+        return False
+
+    # Function to list the whole tree's projects with include_subgroups=true
+    async def crawl_with_include_subgroups(self):
+        projects = {}
+        subgroups = {}
+        group_projects = await self.gitlab_api_interaction.get_all_pages(
+            self.gitlab_api_interaction.get_group_projects(self.group_id, include_subgroups=True)
+        )
+        for project in group_projects:
+            if self.is_ignored(project.namespace_full_path):
+                continue
+            if str(project.namespace_id) != str(self.group_id):
+                subgroups[project.namespace_id] = project.namespace_full_path
+            projects[project.id] = {
+                "id": project.id,
+                "path_with_namespace": project.path_with_namespace,
+                "group_id": project.namespace_id,
+            }
+        return projects, subgroups
+
+    # Function to walk the tree level by level, fetching every group of a level concurrently
+    async def crawl_breadth_first(self):
+        projects = {}
+        subgroups = {}
+        semaphore = asyncio.Semaphore(self.gitlab_api_interaction.collect_concurrency)
+
+        async def crawl_group(group_id):
+            async with semaphore:
+                return await asyncio.gather(
+                    self.gitlab_api_interaction.get_all_pages(
+                        self.gitlab_api_interaction.get_group_projects(group_id)
+                    ),
+                    self.gitlab_api_interaction.get_all_pages(
+                        self.gitlab_api_interaction.get_group_subgroups(group_id)
+                    ),
+                )
+
+        level = [self.group_id]
+        while level:
+            results = await asyncio.gather(*(crawl_group(group_id) for group_id in level))
+            next_level = []
+            for group_id, (group_projects, group_subgroups) in zip(level, results):
+                for project in group_projects:
+                    projects[project.id] = {
+                        "id": project.id,
+                        "path_with_namespace": project.path_with_namespace,
+                        "group_id": group_id,
+                    }
+                for subgroup in group_subgroups:
+                    if self.is_ignored(subgroup["full_path"]) or subgroup["id"] in subgroups:
+                        continue
+                    subgroups[subgroup["id"]] = subgroup["full_path"]
+                    next_level.append(subgroup["id"])
+            level = next_level
+        return projects, subgroups
@@ -1,12 +1,31 @@
 import asyncio
 import logging
-from datetime import datetime, timezone
 import sys
 import os
-from flask import Flask, Response
-from retry import retry
-from prometheus.exporter import PrometheusExporter, generate_latest
-from gitlabApi.gitlab import GitlabApiInteraction
+import signal
+import time
+from aiohttp import web
+from flask import Flask, Response, request
+from prometheus.exporter import PrometheusExporter
+from prometheus.snapshot import MetricsSnapshot
+from prometheus.push import PushSink
+from prometheus.self_metrics import (
+    SELF_REGISTRY,
+    inflight_items,
+    items_processed,
+    shard_items,
+    time_phase,
+)
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+from gitlabApi.gitlab import GitlabApiInteraction, UNFINISHED_STATUSES
+from gitlabApi.inflight import InflightTracker
+from gitlabApi.timestamps import utc_now
+from storage.checkpoint import CheckpointStore
+from collector.dedup import Deduplicator
+from collector.scheduler import Scheduler
+from collector.sharding import Shard
+from collector.stream import RecordStream, iter_owners
+from collector.webhook import WebhookReceiver
 
 # Create Flask App
 app = Flask(__name__)
@@ -18,51 +37,119 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 # Create Prometheus Exporter
 exporter = PrometheusExporter()
+# Encoded metrics served by /metrics, replaced at the end of each cycle
+metrics_snapshot = MetricsSnapshot((REGISTRY, SELF_REGISTRY))
 # Create gitlab api interaction class
 gitlab_api_interaction = GitlabApiInteraction()
-group_id = os.environ.get("GROUP_ID")
-last_fetch_time = None
+# Create checkpoint store for the collection window and unfinished pipelines/jobs
+checkpoint_store = CheckpointStore()
+# Create scheduler of the pipeline and job collection cycles
+scheduler = Scheduler()
+# Create shard of the projects and runners collected by this replica
+shard = Shard()
+# Create sink pushing the served registries to a Pushgateway or remote-write endpoint when PUSH_MODE is set
+push_sink = PushSink(
+    metrics_snapshot.registries, {"shard": str(shard.index)} if shard.count > 1 else {}
+)
+# root groups to collect, comma separated
+group_ids = [group_id for group_id in os.environ.get("GROUP_ID", "").split(",") if group_id]
+# end of the window collected by the last successful cycle of each record type
+last_fetch_times = {"pipeline": None, "job": None}
+# "aiohttp" serves scrapes on the event loop of the collector, "flask" runs the Flask development server in a thread
+server_mode = os.environ.get("SERVER_MODE", "aiohttp")
+webhook_enabled = os.environ.get("WEBHOOK_ENABLED", "false").lower() == "true"
+# only the aiohttp server has the webhook route
+if webhook_enabled and server_mode == "flask":
+    raise Exception("WEBHOOK_ENABLED requires SERVER_MODE=aiohttp, the flask server doesn't receive webhooks")
+# Create receiver of pipeline/job webhook events, polling becomes a low-frequency reconciliation sweep with it
+webhook_receiver = (
+    WebhookReceiver(gitlab_api_interaction.mapping_list, shard) if webhook_enabled else None
+)
+# "batch" selects the records of a whole cycle before turning them into metrics, "stream" turns them into
+# metrics as they're selected, through the bounded stages of collector/stream.py
+collect_mode = os.environ.get("COLLECT_MODE", "batch")
+stream_publish_interval = float(os.environ.get("STREAM_PUBLISH_SECONDS", 5))
+# finished records already observed by the aggregated metrics, shared with the webhook receiver,
+# the records a failed streamed cycle already observed come again with its retry
+observed_records = (
+    webhook_receiver.deduplicator
+    if webhook_receiver is not None
+    else Deduplicator(int(os.environ.get("STREAM_DEDUP_SIZE", 100000)))
+    if collect_mode == "stream"
+    else None
+)
+poll_interval = float(os.environ.get("POLL_INTERVAL_SECONDS", 900 if webhook_enabled else 60))
+pipeline_poll_interval = float(os.environ.get("PIPELINE_POLL_INTERVAL_SECONDS", poll_interval))
+job_poll_interval = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", poll_interval))
+poll_jitter = float(os.environ.get("POLL_JITTER_SECONDS", 5))
+cycle_deadline = float(os.environ.get("CYCLE_DEADLINE_SECONDS", 600)) or None
+# "aggregated" exports histograms and counters without ids, "per_id" the series of every pipeline/job, "both" does both
+metrics_mode = os.environ.get("METRICS_MODE", "aggregated")
+duration_buckets = [
+    float(bucket)
+    for bucket in os.environ.get(
+        "METRICS_DURATION_BUCKETS", "10,30,60,120,300,600,1200,1800,3600,7200"
+    ).split(",")
+]
+queued_duration_buckets = [
+    float(bucket)
+    for bucket in os.environ.get(
+        "METRICS_QUEUED_DURATION_BUCKETS", "1,5,10,30,60,120,300,600,1800"
+    ).split(",")
+]
+# percentiles of the durations over sliding windows, kept by runner, project and job name with DDSketches
+metrics_sketches = os.environ.get("METRICS_SKETCHES", "false").lower() == "true"
+# name used in the summary names -> label the sketches are kept by
+sketch_labelnames = {
+    "pipeline": {"project": "path_with_namespace"},
+    "job": {"runner": "runner_description", "project": "path_with_namespace", "job_name": "job_name"},
+}
+# labels of the aggregated metrics, ids are dropped to keep the cardinality bounded
+aggregated_labelnames = {
+    "pipeline": ["group_id", "path_with_namespace", "source", "ref", "status"],
+    "job": [
+        "group_id",
+        "runner_description",
+        "job_name",
+        "path_with_namespace",
+        "source",
+        "ref",
+        "status",
+    ],
+}
 
 logger.info("Process initialized")
 
 
 # Metrics Define and Initialized
 def init_metrics():
+    if metrics_mode in ("per_id", "both"):
+        init_per_id_metrics()
+    if metrics_mode in ("aggregated", "both"):
+        init_aggregated_metrics()
+    if metrics_sketches:
+        init_sketch_metrics()
+
+
+# Metrics of every pipeline and job, replaced every cycle and ingested a cycle at once
+def init_per_id_metrics():
     # pipeline level
-    exporter.add_gauge_metric(
-        "gitlab_pipeline_duration_seconds",
-        "Duration of GitLab pipeline in seconds",
-        ["group_id", "path_with_namespace", "pipeline_id", "source", "ref", "status"],
-    )
-    exporter.add_gauge_metric(
-        "gitlab_pipeline_queued_duration_seconds",
-        "Queued duration of GitLab pipeline in seconds",
-        ["group_id", "path_with_namespace", "pipeline_id", "source", "ref", "status"],
-    )
-    exporter.add_counter_metric(
-        "gitlab_pipeline_executed_counts",
-        "Executed counts of GitLab pipeline",
+    exporter.add_record_metrics(
+        "gitlab_pipeline_",
         ["group_id", "path_with_namespace", "pipeline_id", "source", "ref", "status"],
-    )
-    # job level
-    exporter.add_gauge_metric(
-        "gitlab_job_duration_seconds",
-        "Duration of GitLab job in seconds",
         [
-            "group_id",
-            "runner_description",
-            "job_id",
-            "job_name",
-            "path_with_namespace",
-            "source",
-            "pipeline_id",
-            "ref",
-            "status",
+            ("duration", "gitlab_pipeline_duration_seconds", "Duration of GitLab pipeline in seconds"),
+            (
+                "queued_duration",
+                "gitlab_pipeline_queued_duration_seconds",
+                "Queued duration of GitLab pipeline in seconds",
+            ),
         ],
+        ("gitlab_pipeline_executed_counts", "Executed counts of GitLab pipeline"),
     )
-    exporter.add_gauge_metric(
-        "gitlab_job_queued_duration_seconds",
-        "Queued duration of GitLab job in seconds",
+    # job level
+    exporter.add_record_metrics(
+        "gitlab_job_",
         [
             "group_id",
             "runner_description",
@@ -74,77 +161,243 @@ def init_metrics():
             "ref",
             "status",
         ],
-    )
-    exporter.add_counter_metric(
-        "gitlab_job_executed_counts",
-        "Executed counts of GitLab job",
         [
-            "group_id",
-            "runner_description",
-            "job_id",
-            "job_name",
-            "path_with_namespace",
-            "source",
-            "pipeline_id",
-            "ref",
-            "status",
+            ("duration", "gitlab_job_duration_seconds", "Duration of GitLab job in seconds"),
+            (
+                "queued_duration",
+                "gitlab_job_queued_duration_seconds",
+                "Queued duration of GitLab job in seconds",
+            ),
         ],
+        ("gitlab_job_executed_counts", "Executed counts of GitLab job"),
     )
 
-# Fetch pipelines for all projects in specific group
-@retry(exceptions=Exception, tries=3, delay=1, backoff=2)
+# Function to drop the unfinished pipelines/jobs of projects/runners moved to another shard
+def drop_foreign_trackers(trackers):
+    for owner_id in [owner_id for owner_id in trackers if not shard.owns(owner_id)]:
+        del trackers[owner_id]
+
+
+# Fetch pipelines for the projects of this shard in the root groups
 async def fetch_project_pipelines(start_time, end_time):
-    try:
-        all_pipelines = {}
-        projects = await gitlab_api_interaction.get_subgroup_projects(group_id)
-        pipelines = await gitlab_api_interaction.select_pipelines_for_execution(
-            projects, start_time, end_time
-        )
-        if pipelines is not None:
-            all_pipelines.update(pipelines)
-        else:
-            logger.info("No pipelines to update")
-        return all_pipelines
-    except Exception as e:
-        logger.error(f"Error occurred: {e}")
+    all_pipelines = {}
+    projects = {}
+    for group_id in group_ids:
+        for project in await gitlab_api_interaction.get_subgroup_projects(group_id):
+            projects[project["id"]] = project
+    projects = shard.select(projects.values())
+    shard_items.labels(kind="project").set(len(projects))
+    drop_foreign_trackers(gitlab_api_interaction.unfinished_pipelines)
+    pipelines = await gitlab_api_interaction.select_pipelines_for_execution(
+        projects, start_time, end_time
+    )
+    if pipelines is not None:
+        all_pipelines.update(pipelines)
+    else:
+        logger.info("No pipelines to update")
+    return all_pipelines
 
 
-# Fetch Jobs for all runber manager in specific group
-@retry(exceptions=Exception, tries=3, delay=1, backoff=2)
+# Fetch Jobs for the runners of this shard in the root groups, a runner shared by groups is collected once,
+# or for the pipelines finished since the last job cycle in pipelines mode
 async def fetch_runner_jobs(start_time, end_time):
-    try:
-        jobs = await gitlab_api_interaction.select_jobs_for_execution(
-            group_id, start_time, end_time
+    if gitlab_api_interaction.job_collection_mode == "pipelines":
+        return await gitlab_api_interaction.select_pipeline_jobs_for_execution()
+    runners = {}
+    for group_id in group_ids:
+        group_runners = await gitlab_api_interaction.fetch_items(
+            gitlab_api_interaction.get_group_runners, group_id
         )
+        for runner in group_runners or []:
+            runners[runner["id"]] = runner
+    runners = shard.select(runners.values())
+    shard_items.labels(kind="runner").set(len(runners))
+    drop_foreign_trackers(gitlab_api_interaction.unfinished_jobs)
+    if not runners:
+        return {}
+    jobs = await gitlab_api_interaction.select_jobs_for_execution(
+        runners, start_time, end_time
+    )
 
-        return jobs
-    except Exception as e:
-        logger.error(f"Error occurred: {e}")
+    return jobs
+
+
+# Topology stage of a streamed pipeline cycle, the projects of this shard are handed over group by group
+async def iter_shard_projects():
+    project_ids = set()
+    for group_id in group_ids:
+        for project in shard.select(await gitlab_api_interaction.get_subgroup_projects(group_id)):
+            if project["id"] not in project_ids:
+                project_ids.add(project["id"])
+                yield project
+    shard_items.labels(kind="project").set(len(project_ids))
+
+
+# Topology stage of a streamed job cycle, a runner shared by groups is handed over once
+async def iter_shard_runners():
+    runner_ids = set()
+    for group_id in group_ids:
+        group_runners = await gitlab_api_interaction.fetch_items(
+            gitlab_api_interaction.get_group_runners, group_id
+        )
+        for runner in shard.select(group_runners or []):
+            if runner["id"] not in runner_ids:
+                runner_ids.add(runner["id"])
+                yield runner
+    shard_items.labels(kind="runner").set(len(runner_ids))
+
+
+# Stream the pipelines of the projects of this shard into the metrics as they're selected
+async def stream_project_pipelines(start_time, end_time):
+    drop_foreign_trackers(gitlab_api_interaction.unfinished_pipelines)
+    iter_pipelines = gitlab_api_interaction.get_project_pipelines_iterator()
+    await stream_records(
+        "pipeline", iter_shard_projects(), iter_pipelines, "project", start_time, end_time
+    )
+    gitlab_api_interaction.log_pipeline_details_stats()
+
+
+# Stream the jobs of the runners of this shard, or of the pipelines finished since the last job cycle
+async def stream_runner_jobs(start_time, end_time):
+    if gitlab_api_interaction.job_collection_mode == "pipelines":
+        pipelines = gitlab_api_interaction.take_pipelines_for_jobs()
+        await stream_records(
+            "job", iter_owners(pipelines), gitlab_api_interaction.iter_pipeline_jobs, "pipeline"
+        )
+        return
+    drop_foreign_trackers(gitlab_api_interaction.unfinished_jobs)
+    await stream_records(
+        "job",
+        iter_shard_runners(),
+        gitlab_api_interaction.iter_runner_jobs,
+        "runner",
+        start_time,
+        end_time,
+    )
+
+
+# run the stages of a streamed cycle, records are turned into metrics in batches and the snapshot is published
+# while they flow in, per-id series which weren't collected again are dropped once the cycle is done
+async def stream_records(record_type, owners, iter_records, owner_type, *args):
+    prefix = f"gitlab_{record_type}_"
+    exporter.start_records(prefix)
+    record_count = 0
+    published_at = time.monotonic()
+
+    def consume(records):
+        nonlocal record_count, published_at
+        record_count += len(records)
+        update_metrics(records, record_type)
+        if time.monotonic() - published_at >= stream_publish_interval:
+            metrics_snapshot.publish()
+            published_at = time.monotonic()
+
+    stream = RecordStream(record_type, gitlab_api_interaction.collect_concurrency)
+    await stream.run(owners, iter_records, consume, owner_type, *args)
+    exporter.sweep_records(prefix)
+    logger.info(f"{record_count} {record_type} records streamed")
+
+
+# Metrics aggregated over pipelines and jobs, accumulated across cycles
+def init_aggregated_metrics():
+    for record_type in ("pipeline", "job"):
+        exporter.add_histogram_metric(
+            f"gitlab_{record_type}_run_duration_seconds",
+            f"Duration of finished GitLab {record_type}s in seconds",
+            aggregated_labelnames[record_type],
+            duration_buckets,
+        )
+        exporter.add_histogram_metric(
+            f"gitlab_{record_type}_run_queued_duration_seconds",
+            f"Queued duration of finished GitLab {record_type}s in seconds",
+            aggregated_labelnames[record_type],
+            queued_duration_buckets,
+        )
+        exporter.add_counter_metric(
+            f"gitlab_{record_type}_runs",
+            f"Finished GitLab {record_type}s",
+            aggregated_labelnames[record_type],
+            cumulative=True,
+        )
 
 
-# insert metrics to default registry
+# Summaries of the durations of pipelines and jobs finished within sliding windows, one per runner, project or job name
+def init_sketch_metrics():
+    for record_type, labelnames in sketch_labelnames.items():
+        for name, labelname in labelnames.items():
+            exporter.add_sketch_metrics(
+                f"gitlab_{record_type}_by_{name}",
+                labelname,
+                [
+                    (
+                        "duration",
+                        f"gitlab_{record_type}_duration_by_{name}_seconds",
+                        f"Duration of the GitLab {record_type}s finished within the window by {labelname}",
+                    ),
+                    (
+                        "queued_duration",
+                        f"gitlab_{record_type}_queued_duration_by_{name}_seconds",
+                        f"Queued duration of the GitLab {record_type}s finished within the window by {labelname}",
+                    ),
+                ],
+            )
+
+
+# insert metrics to default registry, replacing the series of the previous cycle of the same record type
 async def collect_metrics(records, record_type):
+    exporter.clear_metrics(f"gitlab_{record_type}_")
     if not records:
         logger.info(f"No {record_type} to collect")
         return
-    for _, record_attr in records.items():
+    update_metrics(records, record_type)
+
+
+# insert metrics to default registry on top of the current series, used by collect_metrics and the webhook consumer
+def update_metrics(records, record_type, deduplicate=True):
+    items_processed.labels(record_type=record_type).inc(len(records))
+    if metrics_mode in ("aggregated", "both") or metrics_sketches:
+        finished_records = select_finished_records(records, record_type, deduplicate)
+        if metrics_mode in ("aggregated", "both"):
+            collect_aggregated_metrics(finished_records, record_type)
+        if metrics_sketches:
+            exporter.observe_sketches(f"gitlab_{record_type}_", finished_records)
+    if metrics_mode not in ("per_id", "both"):
+        return
+    exporter.ingest_records(f"gitlab_{record_type}_", records.values())
+
+
+# select finished pipelines/jobs to observe once, unfinished ones are observed again when they finish
+# polled records already received by the webhook or observed by a failed streamed cycle are skipped
+def select_finished_records(records, record_type, deduplicate=True):
+    finished_records = []
+    for record_id, record_attr in records.items():
+        if record_attr["status"] in UNFINISHED_STATUSES:
+            continue
+        if (
+            deduplicate
+            and observed_records is not None
+            and not observed_records.first_seen((record_type, record_id, record_attr["status"]))
+        ):
+            continue
+        finished_records.append(record_attr)
+    return finished_records
+
+
+# observe the selected finished records in the duration histograms and the run counters
+def collect_aggregated_metrics(records, record_type):
+    labelnames = aggregated_labelnames[record_type]
+    for record_attr in records:
         try:
-            record_attr["duration"] = record_attr["duration"]
-            record_attr["queued_duration"] = record_attr["queued_duration"]
-            labels = record_attr.copy()
-            del labels["duration"]
-            del labels["queued_duration"]
-            exporter.set_metric(
-                f"gitlab_{record_type}_duration_seconds",
-                labels,
-                record_attr["duration"],
+            labels = {labelname: record_attr[labelname] for labelname in labelnames}
+            exporter.observe_metric(
+                f"gitlab_{record_type}_run_duration_seconds", labels, record_attr["duration"]
             )
-            exporter.set_metric(
-                f"gitlab_{record_type}_queued_duration_seconds",
+            exporter.observe_metric(
+                f"gitlab_{record_type}_run_queued_duration_seconds",
                 labels,
                 record_attr["queued_duration"],
             )
-            exporter.increment_metric(f"gitlab_{record_type}_executed_counts", labels)
+            exporter.increment_metric(f"gitlab_{record_type}_runs", labels)
         except Exception as e:
             logger.error(f"Error occurred: {e}")
 
@@ -157,47 +410,193 @@ def index():
 @app.route("/metrics", methods=["GET"])
 def expose_metrics():
     try:
-        metrics_data = generate_latest()
-        response = Response(metrics_data, mimetype="text/plain")
-        exporter.clear_metrics()
+        metrics_data, content_encoding = metrics_snapshot.render(
+            request.headers.get("Accept-Encoding", "")
+        )
+        response = Response(metrics_data, content_type=CONTENT_TYPE_LATEST)
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
         return response
     except Exception as e:
         error_message = f"Error occurred while exposing metrics: {e}"
         logger.error(error_message)
 
 
+# aiohttp handlers of / and /metrics, they only read the published snapshot so scrapes never wait for a cycle
+async def handle_index(request):
+    return web.Response(text="Ok")
+
+
+async def handle_metrics(request):
+    metrics_data, content_encoding = metrics_snapshot.render(
+        request.headers.get("Accept-Encoding", "")
+    )
+    headers = {"Content-Type": CONTENT_TYPE_LATEST}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return web.Response(body=metrics_data, headers=headers)
+
+
+async def start_server():
+    web_app = web.Application()
+    web_app.router.add_get("/", handle_index)
+    web_app.router.add_get("/metrics", handle_metrics)
+    if webhook_receiver is not None:
+        web_app.router.add_post(webhook_receiver.path, webhook_receiver.handle)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", 8000).start()
+    return runner
+
+
+# run the server and the collector on one loop, SIGTERM/SIGINT stops the collector first
+# so the last snapshot and checkpoint are written before the server goes away
+async def serve():
+    runner = await start_server()
+    fetch_task = asyncio.create_task(start_fetch())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, fetch_task.cancel)
+    try:
+        await fetch_task
+    except asyncio.CancelledError:
+        logger.info("Collector stopped, shutting down the server")
+    finally:
+        await runner.cleanup()
+
+
+# restore the collection window, unfinished pipelines/jobs and pipelines waiting for their jobs saved before
+# the last restart
+def load_checkpoint():
+    watermarks, unfinished, pending_pipelines = checkpoint_store.load()
+    for record_type in last_fetch_times:
+        last_fetch_times[record_type] = watermarks.get(f"{record_type}_last_fetch_time")
+    for project_id, pipeline_ids in unfinished.get("pipeline", {}).items():
+        gitlab_api_interaction.unfinished_pipelines[project_id] = InflightTracker(pipeline_ids)
+    for runner_id, job_ids in unfinished.get("job", {}).items():
+        gitlab_api_interaction.unfinished_jobs[runner_id] = InflightTracker(job_ids)
+    gitlab_api_interaction.pipelines_for_jobs += pending_pipelines
+
+
+# queue the state of the finished cycle to be written by the checkpoint store
+def save_checkpoint():
+    checkpoint_store.save(
+        {
+            f"{record_type}_last_fetch_time": fetch_time
+            for record_type, fetch_time in last_fetch_times.items()
+        },
+        {
+            "pipeline": gitlab_api_interaction.unfinished_pipelines,
+            "job": gitlab_api_interaction.unfinished_jobs,
+        },
+        # the pipeline window moves past them once the pipeline cycle is done
+        gitlab_api_interaction.pipelines_in_job_cycle + gitlab_api_interaction.pipelines_for_jobs,
+    )
+
+
+# get the window of a cycle, it starts where the last successful cycle of the same record type ended
+def get_fetch_window(record_type):
+    start_time = last_fetch_times[record_type]
+    if start_time is None:
+        start_time = utc_now()
+    logger.info(f"{record_type} start_time: {start_time}")
+
+    end_time = utc_now()
+    logger.info(f"{record_type} end_time: {end_time}")
+    return start_time, end_time
+
+
 async def start_fetch():
+    load_checkpoint()
+    await gitlab_api_interaction.response_cache.load()
+    metrics_snapshot.publish()
+    push_sink.start()
+    scheduler.add_task(
+        "pipeline collection", pipeline_cycle, pipeline_poll_interval, poll_jitter, cycle_deadline
+    )
+    scheduler.add_task(
+        "job collection", job_cycle, job_poll_interval, poll_jitter, cycle_deadline
+    )
+    webhook_task = None
+    if webhook_receiver is not None:
+        webhook_task = asyncio.create_task(consume_webhook_records())
+    try:
+        await scheduler.run()
+    finally:
+        if webhook_task is not None:
+            webhook_task.cancel()
+        metrics_snapshot.publish()
+        push_sink.push()
+        await metrics_snapshot.flush()
+        await push_sink.close()
+        await checkpoint_store.flush()
+        checkpoint_store.close()
+        await gitlab_api_interaction.response_cache.flush()
+        await gitlab_api_interaction.close()
+
+
+# apply the records queued by the webhook receiver, the snapshot is published once the queue is drained
+async def consume_webhook_records():
     while True:
-        global last_fetch_time
+        records = await webhook_receiver.get_records()
+        for record_type, typed_records in records.items():
+            if typed_records:
+                update_metrics(typed_records, record_type, deduplicate=False)
+        metrics_snapshot.publish()
 
-        if last_fetch_time is None:
-            start_time = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            start_time = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+# the window only moves forward once its metrics are collected, a cancelled cycle is fetched again
+async def pipeline_cycle():
+    gitlab_api_interaction.retry_policy.start_cycle()
+    start_time, end_time = get_fetch_window("pipeline")
+    with time_phase("pipelines"):
+        if collect_mode == "stream":
+            await stream_project_pipelines(start_time, end_time)
         else:
-            start_time = last_fetch_time
-        logger.info("start_time: %s", start_time)
-
-        end_time = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-        end_time = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-        logger.info(f"end_time: {end_time}")
-
-        last_fetch_time = end_time
-        # fetch pipelines and jobs
-        pipelines = await fetch_project_pipelines(start_time, end_time)
-        jobs = await fetch_runner_jobs(start_time, end_time)
-        # collect jobs and pipelines metrics
-        await collect_metrics(pipelines, "pipeline")
-        await collect_metrics(jobs, "job")
-        # reset gitlab class after finishing one fetch
-        gitlab_api_interaction.reset_init()
-
-@retry(exceptions=Exception, tries=3, delay=1, backoff=2)
-def run_application():    
+            pipelines = await fetch_project_pipelines(start_time, end_time)
+    inflight_items.labels(record_type="pipeline").set(
+        sum(len(tracker) for tracker in gitlab_api_interaction.unfinished_pipelines.values())
+    )
+    with time_phase("collect"):
+        if collect_mode != "stream":
+            await collect_metrics(pipelines, "pipeline")
+        metrics_snapshot.publish()
+        push_sink.push()
+    last_fetch_times["pipeline"] = end_time
+    save_checkpoint()
+
+
+async def job_cycle():
+    gitlab_api_interaction.retry_policy.start_cycle()
+    start_time, end_time = get_fetch_window("job")
+    with time_phase("jobs"):
+        if collect_mode == "stream":
+            await stream_runner_jobs(start_time, end_time)
+        else:
+            jobs = await fetch_runner_jobs(start_time, end_time)
+    inflight_items.labels(record_type="job").set(
+        sum(len(tracker) for tracker in gitlab_api_interaction.unfinished_jobs.values())
+    )
+    with time_phase("collect"):
+        if collect_mode != "stream":
+            await collect_metrics(jobs, "job")
+        metrics_snapshot.publish()
+        push_sink.push()
+    if gitlab_api_interaction.job_collection_mode == "pipelines":
+        gitlab_api_interaction.finish_pipeline_jobs()
+    last_fetch_times["job"] = end_time
+    save_checkpoint()
+
+
+def run_application():
     try:
-        loop = asyncio.get_event_loop()
-        asyncio_task = loop.create_task(start_fetch())
-        app_task = loop.run_in_executor(None, app.run, "0.0.0.0", 8000)
-        loop.run_until_complete(asyncio.gather(asyncio_task, app_task))
+        if server_mode == "flask":
+            loop = asyncio.get_event_loop()
+            asyncio_task = loop.create_task(start_fetch())
+            app_task = loop.run_in_executor(None, app.run, "0.0.0.0", 8000)
+            loop.run_until_complete(asyncio.gather(asyncio_task, app_task))
+        else:
+            asyncio.run(serve())
     except Exception as e:
         logging.error(f"Error occurred: {e}")
 
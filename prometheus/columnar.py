@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from array import array
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+
+# Series of one record type kept column by column, every label value is stored once in a per-label table
+# and the columns keep the index of the value, a whole cycle of records is ingested under a single lock
+# rows are either cleared before a cycle, or tagged with the generation of the cycle which ingested them
+# and swept once it's done, so streamed cycles never expose an empty store
+class ColumnarStore:
+    def __init__(self, labelnames, value_names):
+        self.labelnames = tuple(labelnames)
+        self.value_names = tuple(value_names)
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.reset_columns()
+
+    def reset_columns(self):
+        # label value -> code and code -> label value, for every label
+        self.codes = [{} for _ in self.labelnames]
+        self.label_values = [[] for _ in self.labelnames]
+        self.label_columns = [array("I") for _ in self.labelnames]
+        self.value_columns = [array("d") for _ in self.value_names]
+        self.counts = array("d")
+        self.created = array("d")
+        self.generations = array("I")
+        # codes of the labels -> row, a record seen again overwrites its values and bumps its count
+        self.rows = {}
+
+    def start_generation(self):
+        with self.lock:
+            self.generation += 1
+
+    # Function to drop the rows which weren't ingested since the last start_generation
+    def sweep(self):
+        with self.lock:
+            kept = [row for row, generation in enumerate(self.generations) if generation == self.generation]
+            if len(kept) == len(self.generations):
+                return
+            rows = [
+                (
+                    [values[column[row]] for values, column in zip(self.label_values, self.label_columns)],
+                    [column[row] for column in self.value_columns],
+                    self.counts[row],
+                    self.created[row],
+                )
+                for row in kept
+            ]
+            self.reset_columns()
+            for label_values, values, count, created in rows:
+                key = []
+                for index, value in enumerate(label_values):
+                    code = self.codes[index].get(value)
+                    if code is None:
+                        code = self.codes[index][value] = len(self.label_values[index])
+                        self.label_values[index].append(value)
+                    key.append(code)
+                self.append_row(tuple(key), values, count, created)
+
+    def append_row(self, key, values, count, created):
+        self.rows[key] = len(self.counts)
+        for column, code in zip(self.label_columns, key):
+            column.append(code)
+        for column, value in zip(self.value_columns, values):
+            column.append(value)
+        self.counts.append(count)
+        self.created.append(created)
+        self.generations.append(self.generation)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Function to add the records of a cycle, a record missing a label or a value is logged and skipped
+    def ingest(self, records):
+        now = time.time()
+        with self.lock:
+            codes, label_values = self.codes, self.label_values
+            value_columns, generations, generation = self.value_columns, self.generations, self.generation
+            label_indexes = range(len(self.labelnames))
+            for record in records:
+                try:
+                    key = []
+                    for index in label_indexes:
+                        value = str(record[self.labelnames[index]])
+                        code = codes[index].get(value)
+                        if code is None:
+                            code = codes[index][value] = len(label_values[index])
+                            label_values[index].append(value)
+                        key.append(code)
+                    values = [float(record[value_name] or 0) for value_name in self.value_names]
+                except Exception as e:
+                    logger.error(f"Error occurred: {e}")
+                    continue
+                key = tuple(key)
+                row = self.rows.get(key)
+                if row is None:
+                    self.append_row(key, values, 1, now)
+                    continue
+                for column, value in zip(value_columns, values):
+                    column[row] = value
+                # a row of a previous generation starts counting again like a cleared one
+                if generations[row] == generation:
+                    self.counts[row] += 1
+                else:
+                    self.counts[row] = 1
+                    generations[row] = generation
+
+    # Function to yield the label values, values, count and creation time of every row
+    def iter_rows(self):
+        with self.lock:
+            label_columns = [
+                [values[code] for code in column]
+                for values, column in zip(self.label_values, self.label_columns)
+            ]
+            value_columns = [column.tolist() for column in self.value_columns]
+            counts, created = self.counts.tolist(), self.created.tolist()
+        return zip(zip(*label_columns), zip(*value_columns), counts, created)
+
+
+# Collector exposing the series of a columnar store as gauges of its values and a counter of its rows,
+# the families are built straight from the columns on every collection
+class ColumnarCollector:
+    def __init__(self, store, gauges, counter):
+        self.store = store
+        # [(metric name, description)] in the order of the store's value names
+        self.gauges = gauges
+        # (metric name, description) of the counter of the times a row was ingested
+        self.counter = counter
+
+    def describe(self):
+        labelnames = self.store.labelnames
+        families = [
+            GaugeMetricFamily(name, description, labels=labelnames) for name, description in self.gauges
+        ]
+        return families + [CounterMetricFamily(*self.counter, labels=labelnames)]
+
+    def collect(self):
+        families = self.describe()
+        gauges, counter = families[:-1], families[-1]
+        for label_values, values, count, created in self.store.iter_rows():
+            for family, value in zip(gauges, values):
+                family.add_metric(label_values, value)
+            counter.add_metric(label_values, count, created=created)
+        return gauges + [counter]
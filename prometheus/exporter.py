@@ -1,23 +1,78 @@
 import logging
-from prometheus_client import Counter, Gauge, generate_latest
-import requests
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus.columnar import ColumnarCollector, ColumnarStore
+from prometheus.sketches import SketchCollector, SketchStore
 
 
 class PrometheusExporter:
-    def __init__(self):
+    def __init__(self, registry=REGISTRY):
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+        self.registry = registry
         self.metrics = {}  # Dictionary to store the metrics
+        self.cumulative_metrics = set()  # Metrics kept across cycles by clear_metrics
+        self.record_stores = {}  # Columnar stores of the bulk ingested metrics, by metric name prefix
+        self.sketch_stores = {}  # Sketch stores of the windowed summaries, by name
 
     def add_gauge_metric(self, metric_name, metric_description, labelnames):
         # Create Prometheus Gauge metric
-        metric = Gauge(metric_name, metric_description, labelnames)
+        metric = Gauge(metric_name, metric_description, labelnames, registry=self.registry)
         self.metrics[metric_name] = metric
 
-    def add_counter_metric(self, metric_name, metric_description, labelnames=[]):
+    def add_counter_metric(self, metric_name, metric_description, labelnames=[], cumulative=False):
         # Create Prometheus Gauge metric
-        metric = Counter(metric_name, metric_description, labelnames)
+        metric = Counter(metric_name, metric_description, labelnames, registry=self.registry)
         self.metrics[metric_name] = metric
+        if cumulative:
+            self.cumulative_metrics.add(metric_name)
+
+    def add_histogram_metric(self, metric_name, metric_description, labelnames, buckets):
+        # Create Prometheus Histogram metric, histograms always accumulate across cycles
+        metric = Histogram(
+            metric_name, metric_description, labelnames, buckets=buckets, registry=self.registry
+        )
+        self.metrics[metric_name] = metric
+        self.cumulative_metrics.add(metric_name)
+
+    def add_record_metrics(self, prefix, labelnames, gauges, counter):
+        # Create the gauges of the record values and the counter of the records, ingested a whole cycle at once
+        # gauges is [(value name, metric name, description)], counter is (metric name, description)
+        store = ColumnarStore(labelnames, [value_name for value_name, _, _ in gauges])
+        collector = ColumnarCollector(
+            store, [(metric_name, description) for _, metric_name, description in gauges], counter
+        )
+        self.registry.register(collector)
+        self.record_stores[prefix] = store
+
+    def ingest_records(self, prefix, records):
+        if prefix in self.record_stores:
+            self.record_stores[prefix].ingest(records)
+
+    def start_records(self, prefix=""):
+        # Start a generation of the bulk ingested metrics, the rows not ingested again are dropped by sweep_records
+        for store_prefix, store in self.record_stores.items():
+            if store_prefix.startswith(prefix):
+                store.start_generation()
+
+    def sweep_records(self, prefix=""):
+        for store_prefix, store in self.record_stores.items():
+            if store_prefix.startswith(prefix):
+                store.sweep()
+
+    def add_sketch_metrics(self, name, labelname, summaries):
+        # Create the summaries of record values over sliding windows, kept by a single label and never cleared
+        # summaries is [(value name, metric name, description)]
+        store = SketchStore(labelname, [value_name for value_name, _, _ in summaries])
+        collector = SketchCollector(
+            store, [(metric_name, description) for _, metric_name, description in summaries]
+        )
+        self.registry.register(collector)
+        self.sketch_stores[name] = store
+
+    def observe_sketches(self, prefix, records):
+        for name, store in self.sketch_stores.items():
+            if name.startswith(prefix):
+                store.observe(records)
 
     def increment_metric(self, metric_name, labels, value=1):
         if metric_name in self.metrics:
@@ -27,9 +82,17 @@ class PrometheusExporter:
         if metric_name in self.metrics:
             self.metrics[metric_name].labels(**labels).set(value)
 
-    def clear_metrics(self):
-        for metric in self.metrics.values():
-            metric._metrics.clear()
+    def observe_metric(self, metric_name, labels, value):
+        if metric_name in self.metrics:
+            self.metrics[metric_name].labels(**labels).observe(value)
+
+    def clear_metrics(self, prefix=""):
+        for metric_name, metric in self.metrics.items():
+            if metric_name.startswith(prefix) and metric_name not in self.cumulative_metrics:
+                metric._metrics.clear()
+        for store_prefix, store in self.record_stores.items():
+            if store_prefix.startswith(prefix):
+                store.clear()
 
     def generate_customed_metrics(self):
         # Generate latest metrics for all registered metrics
@@ -0,0 +1,344 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import struct
+import time
+from collections import deque
+import aiohttp
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus.self_metrics import push_batches, push_queue_batches, push_spool_bytes
+
+logger = logging.getLogger(__name__)
+
+REMOTE_WRITE_HEADERS = {
+    "Content-Type": "application/x-protobuf",
+    "Content-Encoding": "snappy",
+    "X-Prometheus-Remote-Write-Version": "0.1.0",
+}
+
+# python-snappy is a dependency, the literal framing below is only a fallback for installs without it, the
+# bodies it frames are valid but uncompressed
+try:
+    import snappy
+
+    snappy_compress = snappy.compress
+except ImportError:
+    snappy_compress = None
+
+
+# Function to frame data as a snappy block made of literals only, every decoder accepts it, used when
+# python-snappy can't be imported
+def snappy_literals(data):
+    chunks = [encode_varint(len(data))]
+    for start in range(0, len(data), 65536):
+        chunk = data[start : start + 65536]
+        size = len(chunk) - 1
+        if size < 60:
+            chunks.append(bytes((size << 2,)))
+        else:
+            chunks.append(b"\xf4" + struct.pack("<H", size))
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+# Function to encode a length-delimited protobuf field
+def encode_field(number, data):
+    return encode_varint(number << 3 | 2) + encode_varint(len(data)) + data
+
+
+# Function to encode a prometheus.WriteRequest, series are (sorted label pairs, value) sharing one timestamp
+# the encoded label pairs are cached as the same names and values repeat over most series
+def encode_write_request(series, timestamp_ms, label_cache):
+    sample_tail = b"\x10" + encode_varint(timestamp_ms)
+    encoded_series = []
+    for labels, value in series:
+        encoded_labels = []
+        for label in labels:
+            encoded_label = label_cache.get(label)
+            if encoded_label is None:
+                encoded_label = label_cache[label] = encode_field(
+                    1, encode_field(1, label[0].encode()) + encode_field(2, label[1].encode())
+                )
+            encoded_labels.append(encoded_label)
+        sample = b"\x09" + struct.pack("<d", value) + sample_tail
+        encoded_series.append(encode_field(1, b"".join(encoded_labels) + encode_field(2, sample)))
+    return b"".join(encoded_series)
+
+
+# Families of one Pushgateway batch, generate_latest accepts any object with a collect method
+class FamilyBatch:
+    def __init__(self):
+        self.families = []
+        self.series = 0
+
+    def collect(self):
+        return self.families
+
+
+# Sink pushing the metrics of the registries at the end of every cycle, batches are sent by a background task,
+# spooled on disk while the sink is down and sent again oldest first once it's back
+class PushSink:
+    def __init__(self, registries, grouping_key):
+        # "" disables pushing, "pushgateway" or "remote_write"
+        self.mode = os.environ.get("PUSH_MODE", "")
+        self.url = os.environ.get("PUSH_URL", "").rstrip("/")
+        if self.mode not in ("", "pushgateway", "remote_write"):
+            raise Exception(f"Unknown PUSH_MODE {self.mode}, expected pushgateway or remote_write")
+        if self.mode and not self.url:
+            raise Exception("PUSH_URL must be set when PUSH_MODE is set")
+        self.job = os.environ.get("PUSH_JOB", "gitlab-ci-exporter")
+        # series per request, a Pushgateway batch never splits a metric family
+        self.batch_size = int(os.environ.get("PUSH_BATCH_SIZE", 2000))
+        self.gzip_enabled = os.environ.get("PUSH_GZIP", "false").lower() == "true"
+        self.timeout = float(os.environ.get("PUSH_TIMEOUT_SECONDS", 10))
+        self.retry_interval = float(os.environ.get("PUSH_RETRY_SECONDS", 5))
+        self.max_retry_interval = float(os.environ.get("PUSH_MAX_RETRY_SECONDS", 300))
+        self.max_pending = int(os.environ.get("PUSH_MAX_PENDING_BATCHES", 1000))
+        self.spool_dir = os.environ.get("PUSH_SPOOL_DIR", "/app/cache/push-spool")
+        self.spool_max_bytes = int(os.environ.get("PUSH_SPOOL_MAX_BYTES", 256 * 1024 * 1024))
+        self.registries = registries
+        # added to every series, as the Pushgateway does with the grouping key
+        self.grouping_key = {"job": self.job, **grouping_key}
+        self.pending = deque()  # (method, url, headers, body) waiting in memory
+        self.spool = deque()  # (path, size) waiting on disk, oldest first
+        self.spool_bytes = 0
+        self.spool_sequence = 0
+        self.spool_enabled = False
+        self.wakeup = asyncio.Event()
+        # set while nothing waits to be sent
+        self.drained = asyncio.Event()
+        self.session = None
+        self.sender_task = None
+
+    @property
+    def enabled(self):
+        return bool(self.mode)
+
+    # Function to start the sender, batches spooled by a previous run are sent first
+    def start(self):
+        if not self.enabled:
+            return
+        if os.path.isdir(os.path.dirname(self.spool_dir.rstrip("/")) or "."):
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self.spool_enabled = True
+            for name in sorted(os.listdir(self.spool_dir)):
+                if name.endswith(".batch"):
+                    path = os.path.join(self.spool_dir, name)
+                    self.spool.append((path, os.path.getsize(path)))
+                    self.spool_bytes += self.spool[-1][1]
+            if self.spool:
+                logger.info(f"{len(self.spool)} spooled push batches to send")
+        else:
+            logger.warning(
+                f"Parent directory of {self.spool_dir} doesn't exist, push batches kept in memory only"
+            )
+        self.update_queue_metrics()
+        self.sender_task = asyncio.create_task(self.run())
+
+    # Function to encode the current metrics into batches and queue them for the sender
+    def push(self):
+        if not self.enabled:
+            return
+        try:
+            if self.mode == "pushgateway":
+                # the Pushgateway keeps the last value only, unsent batches of an older cycle would overwrite newer ones
+                self.discard_queued()
+                batches = self.encode_pushgateway()
+            else:
+                batches = self.encode_remote_write()
+            for batch in batches:
+                self.enqueue(batch)
+        except Exception as e:
+            # pushing is best effort, the cycle's metrics are still served by /metrics
+            logger.error(f"Error occurred while queueing pushed metrics: {e}")
+        self.update_queue_metrics()
+        self.drained.clear()
+        self.wakeup.set()
+
+    def encode_pushgateway(self):
+        url = f"{self.url}/metrics/" + "/".join(
+            f"{name}/{value}" for name, value in self.grouping_key.items()
+        )
+        headers = {"Content-Type": CONTENT_TYPE_LATEST}
+        if self.gzip_enabled:
+            headers["Content-Encoding"] = "gzip"
+        batches = [FamilyBatch()]
+        for registry in self.registries:
+            for family in registry.collect():
+                if batches[-1].series and batches[-1].series + len(family.samples) > self.batch_size:
+                    batches.append(FamilyBatch())
+                batches[-1].families.append(family)
+                batches[-1].series += len(family.samples)
+        # the first batch replaces the whole group so the series of the previous cycle go away, the others add to it
+        for index, batch in enumerate(batches):
+            body = generate_latest(batch)
+            method = "PUT" if index == 0 else "POST"
+            yield method, url, headers, gzip.compress(body) if self.gzip_enabled else body
+
+    def encode_remote_write(self):
+        timestamp_ms = int(time.time() * 1000)
+        label_cache = {}
+        series = []
+        for registry in self.registries:
+            for family in registry.collect():
+                for sample in family.samples:
+                    labels = {**sample.labels, **self.grouping_key, "__name__": sample.name}
+                    series.append((tuple(sorted(labels.items())), sample.value))
+                    if len(series) == self.batch_size:
+                        yield self.remote_write_batch(series, timestamp_ms, label_cache)
+                        series = []
+        if series:
+            yield self.remote_write_batch(series, timestamp_ms, label_cache)
+
+    def remote_write_batch(self, series, timestamp_ms, label_cache):
+        data = encode_write_request(series, timestamp_ms, label_cache)
+        body = snappy_compress(data) if snappy_compress is not None else snappy_literals(data)
+        return "POST", self.url, REMOTE_WRITE_HEADERS, body
+
+    # Function to queue a batch, it goes to disk while older batches are spooled so the order is kept
+    def enqueue(self, batch):
+        if self.spool:
+            self.write_spool(batch)
+            return
+        self.pending.append(batch)
+        if len(self.pending) > self.max_pending:
+            self.pending.popleft()
+            push_batches.labels(result="dropped").inc()
+
+    def write_spool(self, batch):
+        method, url, headers, body = batch
+        self.spool_sequence += 1
+        path = os.path.join(self.spool_dir, f"{time.time_ns():020d}-{self.spool_sequence:06d}.batch")
+        with open(path, "wb") as spool_file:
+            header = json.dumps({"method": method, "url": url, "headers": headers})
+            spool_file.write(header.encode() + b"\n" + body)
+        self.spool.append((path, os.path.getsize(path)))
+        self.spool_bytes += self.spool[-1][1]
+        while self.spool_bytes > self.spool_max_bytes and len(self.spool) > 1:
+            self.remove_spooled()
+            push_batches.labels(result="dropped").inc()
+
+    def read_spool(self, path):
+        with open(path, "rb") as spool_file:
+            header, body = spool_file.read().split(b"\n", 1)
+        header = json.loads(header)
+        return header["method"], header["url"], header["headers"], body
+
+    def remove_spooled(self):
+        path, size = self.spool.popleft()
+        self.spool_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # Function to move the batches waiting in memory to disk, newest last
+    def spill(self):
+        if not self.spool_enabled:
+            return
+        pending, self.pending = self.pending, deque()
+        for batch in pending:
+            self.write_spool(batch)
+
+    def discard_queued(self):
+        discarded = len(self.pending) + len(self.spool)
+        self.pending.clear()
+        while self.spool:
+            self.remove_spooled()
+        if discarded:
+            push_batches.labels(result="superseded").inc(discarded)
+
+    def update_queue_metrics(self):
+        push_queue_batches.labels(queue="memory").set(len(self.pending))
+        push_queue_batches.labels(queue="spool").set(len(self.spool))
+        push_spool_bytes.set(self.spool_bytes)
+
+    # Function to send a batch, returns True when delivered, False when rejected and None when worth a retry
+    async def send(self, batch):
+        method, url, headers, body = batch
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            async with self.session.request(method, url, data=body, headers=headers) as response:
+                if response.status < 300:
+                    return True
+                text = await response.text()
+                if response.status == 429 or response.status >= 500:
+                    logger.warning(f"Push to {url} failed with {response.status}, retrying: {text[:200]}")
+                    return None
+                logger.error(f"Push to {url} rejected with {response.status}: {text[:200]}")
+                return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Push to {url} failed, retrying: {e!r}")
+            return None
+
+    # Function to send the queued batches, spooled ones first, backing off while the sink is down
+    async def run(self):
+        retry_interval = self.retry_interval
+        while True:
+            if self.spool:
+                path = self.spool[0][0]
+                try:
+                    batch = self.read_spool(path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Unreadable spooled push batch {path} dropped: {e}")
+                    self.remove_spooled()
+                    push_batches.labels(result="dropped").inc()
+                    continue
+            elif self.pending:
+                path, batch = None, self.pending[0]
+            else:
+                self.update_queue_metrics()
+                self.drained.set()
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            delivered = await self.send(batch)
+            if delivered is None:
+                push_batches.labels(result="retried").inc()
+                # the sink is down, what waits in memory goes to disk until it's back
+                self.spill()
+                self.update_queue_metrics()
+                await asyncio.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                continue
+            retry_interval = self.retry_interval
+            push_batches.labels(result="sent" if delivered else "rejected").inc()
+            # a new cycle may have discarded the batch meanwhile
+            if path is not None and self.spool and self.spool[0][0] == path:
+                self.remove_spooled()
+            elif path is None and self.pending and self.pending[0] is batch:
+                self.pending.popleft()
+            self.update_queue_metrics()
+
+    # Function to stop the sender once the queued batches are sent, or after PUSH_TIMEOUT_SECONDS,
+    # the batches not sent yet are kept on disk for the next run
+    async def close(self):
+        if self.sender_task is not None:
+            if not self.sender_task.done() and (self.pending or self.spool):
+                try:
+                    await asyncio.wait_for(self.drained.wait(), self.timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"{len(self.pending) + len(self.spool)} push batches not sent before shutdown"
+                    )
+            self.sender_task.cancel()
+            try:
+                await self.sender_task
+            except asyncio.CancelledError:
+                pass
+        self.spill()
+        if self.session is not None:
+            await self.session.close()
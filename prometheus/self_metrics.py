@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+# Registry of the exporter's own metrics, kept apart from the pipeline/job metrics so clear_metrics never touches them
+SELF_REGISTRY = CollectorRegistry()
+
+phase_duration = Histogram(
+    "gitlab_exporter_phase_duration_seconds",
+    "Duration of a phase of a collection cycle",
+    ["phase"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+    registry=SELF_REGISTRY,
+)
+request_duration = Histogram(
+    "gitlab_exporter_request_duration_seconds",
+    "Latency of GitLab API requests by endpoint template",
+    ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=SELF_REGISTRY,
+)
+requests_total = Counter(
+    "gitlab_exporter_requests",
+    "GitLab API requests by endpoint template and response status, connection failures count as error",
+    ["endpoint", "status"],
+    registry=SELF_REGISTRY,
+)
+pages_fetched = Counter(
+    "gitlab_exporter_pages_fetched",
+    "Pages of GitLab list endpoints fetched",
+    ["endpoint"],
+    registry=SELF_REGISTRY,
+)
+http_cache_responses = Counter(
+    "gitlab_exporter_http_cache_responses",
+    "GitLab API responses by endpoint template and whether the cached body was reused on a 304 (hit), "
+    "replaced (changed) or not cached before (miss)",
+    ["endpoint", "result"],
+    registry=SELF_REGISTRY,
+)
+http_cache_evictions = Counter(
+    "gitlab_exporter_http_cache_evictions",
+    "Cached GitLab API responses evicted to stay within the cache limits",
+    registry=SELF_REGISTRY,
+)
+http_cache_bytes = Gauge(
+    "gitlab_exporter_http_cache_bytes",
+    "Bytes of the GitLab API response bodies held by the cache",
+    registry=SELF_REGISTRY,
+)
+items_processed = Counter(
+    "gitlab_exporter_items_processed",
+    "Pipelines and jobs turned into metrics",
+    ["record_type"],
+    registry=SELF_REGISTRY,
+)
+inflight_items = Gauge(
+    "gitlab_exporter_inflight_items",
+    "Unfinished pipelines and jobs tracked between cycles",
+    ["record_type"],
+    registry=SELF_REGISTRY,
+)
+shard_items = Gauge(
+    "gitlab_exporter_shard_items",
+    "Projects and runners assigned to the shard of this replica",
+    ["kind"],
+    registry=SELF_REGISTRY,
+)
+webhook_events = Counter(
+    "gitlab_exporter_webhook_events",
+    "GitLab webhook events received by kind and what happened to them",
+    ["kind", "result"],
+    registry=SELF_REGISTRY,
+)
+webhook_queue_size = Gauge(
+    "gitlab_exporter_webhook_queue_size",
+    "Webhook records waiting to be turned into metrics",
+    registry=SELF_REGISTRY,
+)
+push_batches = Counter(
+    "gitlab_exporter_push_batches",
+    "Batches pushed to the Pushgateway or remote-write endpoint by what happened to them",
+    ["result"],
+    registry=SELF_REGISTRY,
+)
+push_queue_batches = Gauge(
+    "gitlab_exporter_push_queue_batches",
+    "Batches waiting to be pushed, in memory and spooled on disk",
+    ["queue"],
+    registry=SELF_REGISTRY,
+)
+push_spool_bytes = Gauge(
+    "gitlab_exporter_push_spool_bytes",
+    "Bytes of the batches spooled on disk while the push sink is down",
+    registry=SELF_REGISTRY,
+)
+stream_queue_items = Gauge(
+    "gitlab_exporter_stream_queue_items",
+    "Owners and records waiting between the stages of a streamed cycle",
+    ["record_type", "queue"],
+    registry=SELF_REGISTRY,
+)
+scheduler_lag = Gauge(
+    "gitlab_exporter_scheduler_lag_seconds",
+    "Delay between the scheduled and the actual start of the last run of a periodic task",
+    ["task"],
+    registry=SELF_REGISTRY,
+)
+task_last_duration = Gauge(
+    "gitlab_exporter_task_last_duration_seconds",
+    "Duration of the last run of a periodic task",
+    ["task"],
+    registry=SELF_REGISTRY,
+)
+
+
+# Context manager to observe the duration of a cycle phase, failed phases are observed too
+@contextmanager
+def time_phase(phase):
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        phase_duration.labels(phase=phase).observe(time.monotonic() - started_at)
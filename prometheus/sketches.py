@@ -0,0 +1,235 @@
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from operator import add
+from prometheus_client.core import Metric
+from prometheus_client.utils import floatToGoString
+
+logger = logging.getLogger(__name__)
+
+
+# Function to format a window length the way Prometheus writes durations, e.g. 900 -> 15m
+def format_window(seconds):
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % length == 0:
+            return f"{seconds // length}{unit}"
+    return f"{seconds}s"
+
+
+# Logarithmic mapping of the DDSketch bins, a value v goes to the bin ceil(log_gamma(v)) and every value
+# of a bin is within the relative accuracy of the bin's representative value
+class LogarithmicMapping:
+    def __init__(self, relative_accuracy, max_bins):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+
+    def index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, index):
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+
+# DDSketch of non-negative values, zeros are counted apart and the bins are a dense array of counters from
+# the lowest bin in use, beyond max_bins counters the lowest bins are collapsed together so a sketch never
+# takes more memory while the high quantiles stay accurate, two sketches of the same mapping merge by
+# adding their counters
+class DDSketch:
+    __slots__ = ("mapping", "offset", "counts", "zero_count", "count", "sum")
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.offset = 0  # bin index of counts[0]
+        self.counts = array("I")
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = self.mapping.index(value)
+        # a value below the collapsed bins is counted in the lowest one
+        self.counts[max(self.extend(index, index), 0)] += 1
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if not other.counts:
+            return
+        start = self.extend(other.offset, other.offset + len(other.counts) - 1)
+        other_counts = other.counts
+        # the lowest counters of the other sketch may fall below the collapsed ones
+        if start < 0:
+            self.counts[0] += sum(other_counts[:-start])
+            other_counts = other_counts[-start:]
+            start = 0
+        end = start + len(other_counts)
+        self.counts[start:end] = array("I", map(add, self.counts[start:end], other_counts))
+
+    # Function to make room for the bins from lowest to highest, returns the position of the lowest bin,
+    # negative when it's below the bins kept after a collapse
+    def extend(self, lowest, highest):
+        counts = self.counts
+        if not counts:
+            self.offset = max(lowest, highest - self.mapping.max_bins + 1)
+            counts.extend([0] * (highest - self.offset + 1))
+            return lowest - self.offset
+        if lowest < self.offset:
+            counts[0:0] = array("I", [0]) * (self.offset - lowest)
+            self.offset = lowest
+        if highest >= self.offset + len(counts):
+            counts.extend([0] * (highest - self.offset - len(counts) + 1))
+        excess = len(counts) - self.mapping.max_bins
+        if excess > 0:
+            counts[excess] += sum(counts[:excess])
+            del counts[:excess]
+            self.offset += excess
+        return lowest - self.offset
+
+    # Function to get the values at the quantiles, sorted ascending, in a single pass over the bins
+    def quantiles(self, quantiles):
+        if self.count == 0:
+            return [math.nan for _ in quantiles]
+        buckets = [(self.zero_count, 0.0)] if self.zero_count else []
+        buckets += [
+            (count, self.mapping.value(self.offset + position))
+            for position, count in enumerate(self.counts)
+            if count
+        ]
+        values = []
+        position, seen = 0, buckets[0][0]
+        for quantile in quantiles:
+            rank = quantile * (self.count - 1)
+            while seen <= rank and position < len(buckets) - 1:
+                position += 1
+                seen += buckets[position][0]
+            values.append(buckets[position][1])
+        return values
+
+
+# Sketches of the values of finished records keyed by a single label, every key keeps one sketch per
+# value and slice of time so memory is bounded by the slices of the longest window and max_bins, records
+# are put in the slice of their finished_at, or of the time they're observed when they don't have it,
+# and a window is the merge of its most recent slices
+class SketchStore:
+    def __init__(self, labelname, value_names):
+        self.labelname = labelname
+        self.value_names = tuple(value_names)
+        self.windows = sorted(
+            int(window) for window in os.environ.get("SKETCH_WINDOWS_SECONDS", "900,3600").split(",")
+        )
+        self.slice_seconds = int(os.environ.get("SKETCH_SLICE_SECONDS", 300))
+        self.quantiles = sorted(
+            float(quantile)
+            for quantile in os.environ.get("SKETCH_QUANTILES", "0.5,0.9,0.95,0.99").split(",")
+        )
+        self.mapping = LogarithmicMapping(
+            float(os.environ.get("SKETCH_RELATIVE_ACCURACY", 0.01)),
+            int(os.environ.get("SKETCH_MAX_BINS", 512)),
+        )
+        # slices of every window, the current slice is only partly elapsed
+        self.window_slices = [-(-window // self.slice_seconds) for window in self.windows]
+        self.lock = threading.Lock()
+        self.series = {}  # label value -> {slice number: [sketch of every value]}
+
+    def __len__(self):
+        return len(self.series)
+
+    def observe(self, records):
+        current = int(time.time() // self.slice_seconds)
+        oldest = current - self.window_slices[-1] + 1
+        with self.lock:
+            for record in records:
+                try:
+                    label = str(record[self.labelname])
+                    finished_at = record.get("finished_at")
+                    slice_number = (
+                        int(finished_at / 1e6 // self.slice_seconds) if finished_at else current
+                    )
+                    values = [float(record[value_name] or 0) for value_name in self.value_names]
+                except Exception as e:
+                    logger.error(f"Error occurred: {e}")
+                    continue
+                # older than the longest window, or ahead of the clock of this host
+                if slice_number < oldest:
+                    continue
+                slice_number = min(slice_number, current)
+                slices = self.series.setdefault(label, {})
+                sketches = slices.get(slice_number)
+                if sketches is None:
+                    sketches = slices[slice_number] = [DDSketch(self.mapping) for _ in self.value_names]
+                for sketch, value in zip(sketches, values):
+                    sketch.add(value)
+
+    # Function to drop the slices which left the longest window, and the keys with nothing left in it
+    def expire(self, current):
+        oldest = current - self.window_slices[-1] + 1
+        for label in list(self.series):
+            slices = self.series[label]
+            for slice_number in [number for number in slices if number < oldest]:
+                del slices[slice_number]
+            if not slices:
+                del self.series[label]
+
+    # Function to get the label value, the window and the (quantiles, count, sum) of every value for every
+    # key and window, the slices of a key are merged once from the newest, each window taking the merge so far
+    def summarize(self):
+        current = int(time.time() // self.slice_seconds)
+        summaries = []
+        with self.lock:
+            self.expire(current)
+            for label, slices in self.series.items():
+                merged = [DDSketch(self.mapping) for _ in self.value_names]
+                slice_numbers = sorted(slices, reverse=True)
+                position = 0
+                for window, window_slices in zip(self.windows, self.window_slices):
+                    first = current - window_slices + 1
+                    while position < len(slice_numbers) and slice_numbers[position] >= first:
+                        for sketch, slice_sketch in zip(merged, slices[slice_numbers[position]]):
+                            sketch.merge(slice_sketch)
+                        position += 1
+                    if merged[0].count:
+                        summaries.append(
+                            (
+                                label,
+                                window,
+                                [
+                                    (sketch.quantiles(self.quantiles), sketch.count, sketch.sum)
+                                    for sketch in merged
+                                ],
+                            )
+                        )
+        return summaries
+
+
+# Collector exposing a sketch store as one summary per value, with the quantiles, count and sum of every
+# key over every window, the quantiles are computed on every collection
+class SketchCollector:
+    def __init__(self, store, summaries):
+        self.store = store
+        # [(metric name, description)] in the order of the store's value names
+        self.summaries = summaries
+
+    def describe(self):
+        return [Metric(name, description, "summary") for name, description in self.summaries]
+
+    def collect(self):
+        families = self.describe()
+        quantile_labels = [floatToGoString(quantile) for quantile in self.store.quantiles]
+        for label, window, summaries in self.store.summarize():
+            labels = {self.store.labelname: label, "window": format_window(window)}
+            for family, (values, count, total) in zip(families, summaries):
+                for quantile_label, value in zip(quantile_labels, values):
+                    family.add_sample(family.name, dict(labels, quantile=quantile_label), value)
+                family.add_sample(f"{family.name}_count", labels, count)
+                family.add_sample(f"{family.name}_sum", labels, total)
+        return families
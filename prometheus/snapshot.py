@@ -0,0 +1,56 @@
+import asyncio
+import gzip
+import logging
+import os
+import time
+from prometheus_client import REGISTRY, generate_latest
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSnapshot:
+    def __init__(self, registries=(REGISTRY,)):
+        self.registries = registries
+        self.gzip_enabled = os.environ.get("METRICS_GZIP", "true").lower() == "true"
+        self.gzip_level = int(os.environ.get("METRICS_GZIP_LEVEL", 6))
+        # (plain bytes, gzip bytes, publish time) replaced as a whole so readers never see a partial snapshot
+        self.current = (b"", None, None)
+        self.publish_pending = False
+        self.publisher_task = None
+
+    # Function to queue a publish, publishes issued while the registries are being encoded are coalesced
+    # into the next encode
+    def publish(self):
+        self.publish_pending = True
+        if self.publisher_task is None or self.publisher_task.done():
+            self.publisher_task = asyncio.create_task(self.publish_pending_snapshots())
+
+    # Function to encode the registries in a worker thread until nothing is pending, each result is swapped in
+    # for every following scrape so neither the encoding nor the gzip blocks the loop
+    async def publish_pending_snapshots(self):
+        loop = asyncio.get_running_loop()
+        while self.publish_pending:
+            self.publish_pending = False
+            try:
+                data, gzip_data = await loop.run_in_executor(None, self.encode)
+            except Exception as e:
+                logger.error(f"Error occurred while encoding metrics: {e}")
+                continue
+            self.current = (data, gzip_data, time.time())
+
+    def encode(self):
+        data = b"".join(generate_latest(registry) for registry in self.registries)
+        gzip_data = gzip.compress(data, self.gzip_level) if self.gzip_enabled else None
+        return data, gzip_data
+
+    # Function to wait for the queued publish to be swapped in, used on shutdown
+    async def flush(self):
+        if self.publisher_task is not None:
+            await self.publisher_task
+
+    # Function to get the bytes to serve, gzip is used when the scraper accepts it
+    def render(self, accept_encoding=""):
+        data, gzip_data, _ = self.current
+        if gzip_data is not None and "gzip" in accept_encoding:
+            return gzip_data, "gzip"
+        return data, None
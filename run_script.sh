@@ -7,4 +7,4 @@ if [ -z "$1" ]; then
 fi
 
 # execute the given python file
-python "$1"
\ No newline at end of file
+exec python "$1"
\ No newline at end of file
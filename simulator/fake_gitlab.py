@@ -0,0 +1,401 @@
+import asyncio
+import hashlib
+import heapq
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+REFS = ("main", "develop", "release", "feature")
+SOURCES = ("push", "merge_request_event", "schedule", "web")
+
+
+# Function to format an epoch timestamp the way GitLab does, e.g. 2023-08-01T10:00:00.123Z
+def format_time(timestamp):
+    if timestamp is None:
+        return None
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+# Function to get the state of a pipeline or job at the given time, it runs through pending, running and its result
+def get_state(item, now):
+    if now < item["started_at"]:
+        return "pending", None, None, None
+    if now < item["finished_at"]:
+        return "running", item["started_at"], None, None
+    return item["result"], item["started_at"], item["finished_at"], item["finished_at"] - item["started_at"]
+
+
+# Fake GitLab API serving a synthetic group tree whose pipelines and jobs are generated as time passes
+class FakeGitlab:
+    def __init__(self):
+        self.seed = int(os.environ.get("SIM_SEED", 1))
+        self.group_depth = int(os.environ.get("SIM_GROUP_DEPTH", 2))
+        self.subgroups_per_group = int(os.environ.get("SIM_SUBGROUPS_PER_GROUP", 2))
+        self.projects_per_group = int(os.environ.get("SIM_PROJECTS_PER_GROUP", 5))
+        self.runner_count = int(os.environ.get("SIM_RUNNERS", 4))
+        # pipelines created per minute in every project, jobs created per pipeline
+        self.pipeline_rate = float(os.environ.get("SIM_PIPELINES_PER_MINUTE", 1))
+        self.jobs_per_pipeline = int(os.environ.get("SIM_JOBS_PER_PIPELINE", 3))
+        self.mean_duration = float(os.environ.get("SIM_MEAN_DURATION_SECONDS", 120))
+        self.mean_queued_duration = float(os.environ.get("SIM_MEAN_QUEUED_SECONDS", 10))
+        self.failure_rate = float(os.environ.get("SIM_FAILURE_RATE", 0.1))
+        self.history = float(os.environ.get("SIM_HISTORY_MINUTES", 60)) * 60
+        self.latency = float(os.environ.get("SIM_LATENCY_MS", 20)) / 1000
+        self.latency_jitter = float(os.environ.get("SIM_LATENCY_JITTER_MS", 10)) / 1000
+        # requests per minute allowed for each token, and the share of requests answered with 429 anyway
+        self.rate_limit = int(os.environ.get("SIM_RATE_LIMIT", 2000))
+        self.throttle_probability = float(os.environ.get("SIM_429_PROBABILITY", 0))
+        self.retry_after = int(os.environ.get("SIM_RETRY_AFTER_SECONDS", 1))
+        self.max_per_page = int(os.environ.get("SIM_MAX_PER_PAGE", 100))
+        # answer If-None-Match with 304 like GitLab's weak ETags do
+        self.etags = os.environ.get("SIM_ETAG", "true").lower() == "true"
+
+        self.random = random.Random(self.seed)
+        self.groups = {}
+        self.projects = {}
+        self.runners = [
+            {"id": index + 1, "description": f"sim-runner-{index + 1}", "active": True}
+            for index in range(self.runner_count)
+        ]
+        self.pipelines = {}
+        self.pipelines_by_id = {}
+        self.jobs_by_runner = {runner["id"]: [] for runner in self.runners}
+        self.jobs_by_pipeline = {}
+        self.next_pipeline_id = 1
+        self.next_job_id = 1
+        self.request_counts = Counter()
+        self.throttled = 0
+        self.not_modified = 0
+        self.token_windows = {}
+
+        self.build_groups()
+        started_at = time.time() - self.history
+        # next pipeline creation time of every project, popped in time order so ids grow like GitLab's
+        self.schedule = [
+            (started_at + self.next_interval(), project_id) for project_id in self.projects
+        ]
+        heapq.heapify(self.schedule)
+        self.advance(time.time())
+
+    # Function to build the group tree, every group holds projects and the first levels hold subgroups
+    def build_groups(self):
+        self.root_group_id = 1
+        self.groups[1] = {"id": 1, "full_path": "sim", "parent_id": None}
+        level = [1]
+        for _ in range(self.group_depth):
+            next_level = []
+            for parent_id in level:
+                for index in range(self.subgroups_per_group):
+                    group_id = len(self.groups) + 1
+                    full_path = f"{self.groups[parent_id]['full_path']}/group-{group_id}"
+                    self.groups[group_id] = {"id": group_id, "full_path": full_path, "parent_id": parent_id}
+                    next_level.append(group_id)
+            level = next_level
+
+        for group in self.groups.values():
+            for index in range(self.projects_per_group):
+                project_id = len(self.projects) + 1
+                self.projects[project_id] = {
+                    "id": project_id,
+                    "name": f"project-{project_id}",
+                    "path_with_namespace": f"{group['full_path']}/project-{project_id}",
+                    "namespace": {"id": group["id"], "full_path": group["full_path"], "kind": "group"},
+                }
+                self.pipelines[project_id] = []
+
+    def next_interval(self):
+        if self.pipeline_rate <= 0:
+            return float("inf")
+        return self.random.expovariate(self.pipeline_rate / 60)
+
+    # Function to create the pipelines and jobs of every project up to the given time
+    def advance(self, now):
+        while self.schedule and self.schedule[0][0] <= now:
+            created_at, project_id = heapq.heappop(self.schedule)
+            self.create_pipeline(project_id, created_at)
+            heapq.heappush(self.schedule, (created_at + self.next_interval(), project_id))
+
+    def create_pipeline(self, project_id, created_at):
+        started_at = created_at + self.random.expovariate(1 / self.mean_queued_duration)
+        duration = max(1, self.random.expovariate(1 / self.mean_duration))
+        result = "failed" if self.random.random() < self.failure_rate else "success"
+        pipeline = {
+            "id": self.next_pipeline_id,
+            "project_id": project_id,
+            "ref": self.random.choice(REFS),
+            "source": self.random.choice(SOURCES),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": started_at + duration,
+            "result": result,
+        }
+        self.next_pipeline_id += 1
+        self.pipelines[project_id].append(pipeline)
+        self.pipelines_by_id[pipeline["id"]] = pipeline
+
+        jobs = []
+        job_duration = duration / max(self.jobs_per_pipeline, 1)
+        for index in range(self.jobs_per_pipeline):
+            job_started_at = started_at + index * job_duration
+            queued_duration = min(
+                self.random.expovariate(1 / self.mean_queued_duration), job_started_at - created_at
+            )
+            runner = self.random.choice(self.runners)
+            job = {
+                "id": self.next_job_id,
+                "name": f"job-{index + 1}",
+                "pipeline": pipeline,
+                "runner": runner,
+                "created_at": created_at,
+                "started_at": job_started_at,
+                "finished_at": job_started_at + job_duration,
+                "queued_duration": queued_duration,
+                # only the last job carries the failure of a failed pipeline
+                "result": result if index == self.jobs_per_pipeline - 1 else "success",
+            }
+            self.next_job_id += 1
+            jobs.append(job)
+            self.jobs_by_runner[runner["id"]].append(job)
+        self.jobs_by_pipeline[pipeline["id"]] = jobs
+
+    def render_pipeline(self, pipeline, now, details=False):
+        status, started_at, finished_at, duration = get_state(pipeline, now)
+        updated_at = finished_at or started_at or pipeline["created_at"]
+        rendered = {
+            "id": pipeline["id"],
+            "iid": pipeline["id"],
+            "project_id": pipeline["project_id"],
+            "ref": pipeline["ref"],
+            "source": pipeline["source"],
+            "status": status,
+            "created_at": format_time(pipeline["created_at"]),
+            "updated_at": format_time(updated_at),
+        }
+        if details:
+            rendered.update(
+                {
+                    "started_at": format_time(started_at),
+                    "finished_at": format_time(finished_at),
+                    "duration": int(duration) if duration is not None else None,
+                    "queued_duration": pipeline["started_at"] - pipeline["created_at"]
+                    if started_at is not None
+                    else None,
+                }
+            )
+        return rendered
+
+    def render_job(self, job, now):
+        status, started_at, finished_at, duration = get_state(job, now)
+        pipeline = job["pipeline"]
+        project = self.projects[pipeline["project_id"]]
+        return {
+            "id": job["id"],
+            "name": job["name"],
+            "ref": pipeline["ref"],
+            "status": status,
+            "created_at": format_time(job["created_at"]),
+            "started_at": format_time(started_at),
+            "finished_at": format_time(finished_at),
+            "duration": duration,
+            "queued_duration": job["queued_duration"] if started_at is not None else None,
+            "pipeline": {
+                "id": pipeline["id"],
+                "project_id": pipeline["project_id"],
+                "ref": pipeline["ref"],
+                "source": pipeline["source"],
+                "status": get_state(pipeline, now)[0],
+            },
+            "project": {
+                "id": project["id"],
+                "name": project["name"],
+                "path_with_namespace": project["path_with_namespace"],
+            },
+            "runner": {"id": job["runner"]["id"], "description": job["runner"]["description"]},
+        }
+
+    # Function to answer a list endpoint with GitLab's offset pagination headers
+    def paginated(self, request, items):
+        page = max(int(request.query.get("page", 1)), 1)
+        per_page = min(max(int(request.query.get("per_page", 20)), 1), self.max_per_page)
+        start = (page - 1) * per_page
+        headers = {"X-Page": str(page), "X-Per-Page": str(per_page), "X-Total": str(len(items))}
+        has_next = start + per_page < len(items)
+        headers["X-Next-Page"] = str(page + 1) if has_next else ""
+        if has_next:
+            next_url = request.url.update_query(page=page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return web.json_response(items[start : start + per_page], headers=headers)
+
+    def sort_desc(self, request):
+        return request.query.get("sort", "desc") == "desc"
+
+    # Function to count a request against its token's window, returns the rate limit headers and whether it's rejected
+    def check_rate_limit(self, token, now):
+        window_start, count = self.token_windows.get(token, (now, 0))
+        if now - window_start >= 60:
+            window_start, count = now, 0
+        count += 1
+        self.token_windows[token] = (window_start, count)
+        reset_at = int(window_start + 60)
+        headers = {
+            "RateLimit-Limit": str(self.rate_limit),
+            "RateLimit-Remaining": str(max(self.rate_limit - count, 0)),
+            "RateLimit-Reset": str(reset_at),
+        }
+        if count > self.rate_limit:
+            headers["Retry-After"] = str(max(reset_at - int(now), 1))
+            return headers, True
+        if self.throttle_probability and self.random.random() < self.throttle_probability:
+            headers["Retry-After"] = str(self.retry_after)
+            return headers, True
+        return headers, False
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if not request.path.startswith("/api/v4/"):
+            return await handler(request)
+        route = request.match_info.route.resource
+        self.request_counts[route.canonical if route is not None else request.path] += 1
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(max(0, self.latency + self.random.uniform(-1, 1) * self.latency_jitter))
+
+        token = request.headers.get("PRIVATE-TOKEN")
+        if not token:
+            return web.json_response({"message": "401 Unauthorized"}, status=401)
+        now = time.time()
+        headers, throttled = self.check_rate_limit(token, now)
+        if throttled:
+            self.throttled += 1
+            return web.json_response({"message": "429 Too Many Requests"}, status=429, headers=headers)
+
+        self.advance(now)
+        response = await handler(request)
+        if self.etags and response.status == 200 and isinstance(response.body, bytes):
+            etag = f'W/"{hashlib.md5(response.body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                response = web.Response(status=304)
+            response.headers["ETag"] = etag
+        response.headers.update(headers)
+        return response
+
+    async def get_subgroups(self, request):
+        group_id = int(request.match_info["group_id"])
+        subgroups = [
+            {"id": group["id"], "full_path": group["full_path"], "parent_id": group["parent_id"]}
+            for group in self.groups.values()
+            if group["parent_id"] == group_id
+        ]
+        return self.paginated(request, subgroups)
+
+    async def get_group_projects(self, request):
+        group_id = int(request.match_info["group_id"])
+        if group_id not in self.groups:
+            return web.json_response({"message": "404 Group Not Found"}, status=404)
+        full_path = self.groups[group_id]["full_path"]
+        include_subgroups = request.query.get("include_subgroups") == "true"
+        projects = [
+            project
+            for project in self.projects.values()
+            if project["namespace"]["id"] == group_id
+            or (include_subgroups and project["namespace"]["full_path"].startswith(f"{full_path}/"))
+        ]
+        return self.paginated(request, projects)
+
+    async def get_group_runners(self, request):
+        return self.paginated(request, self.runners)
+
+    async def get_project_pipelines(self, request):
+        project_id = int(request.match_info["project_id"])
+        now = time.time()
+        pipelines = [
+            self.render_pipeline(pipeline, now) for pipeline in self.pipelines.get(project_id, [])
+        ]
+        if "updated_after" in request.query:
+            updated_after = parse_time(request.query["updated_after"])
+            pipelines = [p for p in pipelines if parse_time(p["updated_at"]) >= updated_after]
+        if "updated_before" in request.query:
+            updated_before = parse_time(request.query["updated_before"])
+            pipelines = [p for p in pipelines if parse_time(p["updated_at"]) <= updated_before]
+        sort_key = "updated_at" if request.query.get("order_by") == "updated_at" else "id"
+        pipelines.sort(key=lambda pipeline: pipeline[sort_key], reverse=self.sort_desc(request))
+        return self.paginated(request, pipelines)
+
+    async def get_pipeline(self, request):
+        pipeline = self.pipelines_by_id.get(int(request.match_info["pipeline_id"]))
+        if pipeline is None or pipeline["project_id"] != int(request.match_info["project_id"]):
+            return web.json_response({"message": "404 Not found"}, status=404)
+        return web.json_response(self.render_pipeline(pipeline, time.time(), details=True))
+
+    async def get_pipeline_jobs(self, request):
+        now = time.time()
+        jobs = [
+            self.render_job(job, now)
+            for job in self.jobs_by_pipeline.get(int(request.match_info["pipeline_id"]), [])
+        ]
+        return self.paginated(request, jobs)
+
+    async def get_runner_jobs(self, request):
+        now = time.time()
+        jobs = self.jobs_by_runner.get(int(request.match_info["runner_id"]), [])
+        if self.sort_desc(request):
+            jobs = jobs[::-1]
+        rendered = [self.render_job(job, now) for job in jobs]
+        if "status" in request.query:
+            rendered = [job for job in rendered if job["status"] == request.query["status"]]
+        return self.paginated(request, rendered)
+
+    async def get_stats(self, request):
+        return web.json_response(
+            {
+                "requests": sum(self.request_counts.values()),
+                "throttled": self.throttled,
+                "not_modified": self.not_modified,
+                "by_endpoint": dict(self.request_counts),
+                "pipelines": self.next_pipeline_id - 1,
+                "jobs": self.next_job_id - 1,
+                "root_group_id": self.root_group_id,
+            }
+        )
+
+    def create_app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/api/v4/groups/{group_id}/subgroups", self.get_subgroups)
+        app.router.add_get("/api/v4/groups/{group_id}/projects", self.get_group_projects)
+        app.router.add_get("/api/v4/groups/{group_id}/runners", self.get_group_runners)
+        app.router.add_get("/api/v4/projects/{project_id}/pipelines", self.get_project_pipelines)
+        app.router.add_get("/api/v4/projects/{project_id}/pipelines/{pipeline_id}", self.get_pipeline)
+        app.router.add_get(
+            "/api/v4/projects/{project_id}/pipelines/{pipeline_id}/jobs", self.get_pipeline_jobs
+        )
+        app.router.add_get("/api/v4/runners/{runner_id}/jobs", self.get_runner_jobs)
+        app.router.add_get("/-/stats", self.get_stats)
+        return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    fake_gitlab = FakeGitlab()
+    logger.info(
+        f"Fake GitLab with {len(fake_gitlab.groups)} groups, {len(fake_gitlab.projects)} projects, "
+        f"{fake_gitlab.next_pipeline_id - 1} pipelines of history"
+    )
+    web.run_app(
+        fake_gitlab.create_app(),
+        host=os.environ.get("SIM_HOST", "127.0.0.1"),
+        port=int(os.environ.get("SIM_PORT", 18080)),
+        print=None,
+        access_log=None,
+    )
@@ -0,0 +1,197 @@
+import logging
+import os
+import random
+import sys
+from collections import Counter
+from aiohttp import web
+from prometheus_client.parser import text_string_to_metric_families
+
+logger = logging.getLogger(__name__)
+
+try:
+    import snappy
+
+    snappy_decompress = snappy.decompress
+except ImportError:
+    snappy_decompress = None
+
+
+def read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+# Function to decode a snappy block, literals and the three kinds of copies
+def decompress_snappy(data):
+    if snappy_decompress is not None:
+        return snappy_decompress(data)
+    length, position = read_varint(data, 0)
+    decoded = bytearray()
+    while position < len(data):
+        tag = data[position]
+        position += 1
+        kind = tag & 3
+        if kind == 0:
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[position : position + extra], "little")
+                position += extra
+            decoded += data[position : position + size + 1]
+            position += size + 1
+            continue
+        if kind == 1:
+            size = (tag >> 2 & 7) + 4
+            offset = (tag >> 5) << 8 | data[position]
+            position += 1
+        else:
+            extra = 2 if kind == 2 else 4
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[position : position + extra], "little")
+            position += extra
+        if offset == 0 or offset > len(decoded):
+            raise ValueError("Invalid snappy copy offset")
+        # a copy may overlap the bytes it produces
+        for _ in range(size):
+            decoded.append(decoded[-offset])
+    if len(decoded) != length:
+        raise ValueError(f"Snappy block decoded to {len(decoded)} bytes instead of {length}")
+    return bytes(decoded)
+
+
+# Function to iterate over the (field number, value) of a protobuf message
+def iter_fields(data):
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position : position + 8], position + 8
+        elif wire_type == 2:
+            size, position = read_varint(data, position)
+            value, position = data[position : position + size], position + size
+        elif wire_type == 5:
+            value, position = data[position : position + 4], position + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+
+# Function to decode a prometheus.WriteRequest into (labels, sample count) of every series
+def decode_write_request(data):
+    for number, series in iter_fields(data):
+        if number != 1:
+            continue
+        labels, samples = {}, 0
+        for field, value in iter_fields(series):
+            if field == 1:
+                label = dict(iter_fields(value))
+                labels[label.get(1, b"").decode()] = label.get(2, b"").decode()
+            elif field == 2:
+                samples += 1
+        yield labels, samples
+
+
+# Stand-in of a Pushgateway and a remote-write endpoint recording what it receives, it can be made to fail
+# to exercise the retries and the spool of the push mode
+class PushReceiver:
+    def __init__(self):
+        self.failure_rate = float(os.environ.get("PUSH_RECEIVER_FAILURE_RATE", 0))
+        self.down = os.environ.get("PUSH_RECEIVER_DOWN", "false").lower() == "true"
+        self.random = random.Random(int(os.environ.get("SIM_SEED", 1)))
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.samples = 0
+        # latest series of every Pushgateway group and every remote-write series seen
+        self.groups = {}
+        self.series = set()
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith("/-/"):
+            return await handler(request)
+        if self.down or self.random.random() < self.failure_rate:
+            self.requests["failed"] += 1
+            return web.Response(status=503, text="Receiver unavailable")
+        return await handler(request)
+
+    async def push_to_group(self, request):
+        # aiohttp already inflates gzip bodies
+        body = await request.read()
+        self.bytes_received += len(body)
+        try:
+            families = list(text_string_to_metric_families(body.decode()))
+        except ValueError as e:
+            self.requests["invalid"] += 1
+            return web.Response(status=400, text=f"Invalid exposition: {e}")
+        group = request.match_info["grouping_key"]
+        # PUT replaces the whole group, POST the metrics of the same names
+        series = {} if request.method == "PUT" else self.groups.get(group, {})
+        for family in families:
+            series[family.name] = len(family.samples)
+            self.samples += len(family.samples)
+        self.groups[group] = series
+        self.requests[request.method.lower()] += 1
+        return web.Response(status=200)
+
+    async def remote_write(self, request):
+        body = await request.read()
+        self.bytes_received += len(body)
+        try:
+            data = decompress_snappy(body)
+            for labels, samples in decode_write_request(data):
+                self.series.add(tuple(sorted(labels.items())))
+                self.samples += samples
+        except (ValueError, IndexError) as e:
+            self.requests["invalid"] += 1
+            return web.Response(status=400, text=f"Invalid write request: {e}")
+        self.requests["write"] += 1
+        return web.Response(status=204)
+
+    async def set_down(self, request):
+        self.down = request.match_info["state"] == "down"
+        return web.Response(text="down" if self.down else "up")
+
+    async def get_stats(self, request):
+        return web.json_response(
+            {
+                "requests": dict(self.requests),
+                "bytes_received": self.bytes_received,
+                "samples": self.samples,
+                "remote_write_series": len(self.series),
+                "groups": {
+                    group: sum(series.values()) for group, series in self.groups.items()
+                },
+                "down": self.down,
+            }
+        )
+
+    def create_app(self):
+        app = web.Application(middlewares=[self.middleware], client_max_size=64 * 1024 * 1024)
+        app.router.add_route("PUT", "/metrics/{grouping_key:.+}", self.push_to_group)
+        app.router.add_route("POST", "/metrics/{grouping_key:.+}", self.push_to_group)
+        app.router.add_post("/api/v1/write", self.remote_write)
+        app.router.add_post("/-/{state:up|down}", self.set_down)
+        app.router.add_get("/-/stats", self.get_stats)
+        return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    push_receiver = PushReceiver()
+    logger.info("Push receiver serving /metrics/job/... and /api/v1/write")
+    web.run_app(
+        push_receiver.create_app(),
+        host=os.environ.get("PUSH_RECEIVER_HOST", "127.0.0.1"),
+        port=int(os.environ.get("PUSH_RECEIVER_PORT", 19091)),
+        print=None,
+        access_log=None,
+    )
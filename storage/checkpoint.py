@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    def __init__(self):
+        self.path = os.environ.get("CHECKPOINT_PATH", "/app/cache/checkpoint.db")
+        self.enabled = os.environ.get("CHECKPOINT_ENABLED", "true").lower() == "true"
+        # a watermark older than this is ignored so a long outage doesn't trigger a huge backfill
+        self.max_age = float(os.environ.get("CHECKPOINT_MAX_AGE_SECONDS", 86400))
+        self.connection = None
+        self.pending_state = None
+        self.writer_task = None
+        # rows known to be on disk, used to write only the difference of each checkpoint
+        self.written_watermarks = {}
+        self.written_unfinished = set()
+        self.written_pending_pipelines = set()
+
+    # Function to open the database in WAL mode, the store is disabled if the volume isn't mounted
+    def open(self):
+        if not self.enabled:
+            return False
+        if not os.path.isdir(os.path.dirname(self.path) or "."):
+            logger.warning(f"Checkpoint directory of {self.path} doesn't exist, checkpoint disabled")
+            self.enabled = False
+            return False
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS unfinished ("
+            "kind TEXT NOT NULL, owner_id INTEGER NOT NULL, item_id INTEGER NOT NULL, "
+            "PRIMARY KEY (kind, owner_id, item_id)) WITHOUT ROWID"
+        )
+        # finished pipelines whose jobs weren't collected yet in pipelines mode
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pending_pipelines ("
+            "pipeline_id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL, "
+            "path_with_namespace TEXT NOT NULL, source TEXT)"
+        )
+        self.connection.commit()
+        return True
+
+    # Function to load the last checkpoint, returns the watermarks, the unfinished ids per kind and owner and
+    # the pipelines waiting for their jobs to be collected
+    def load(self):
+        watermarks = {}
+        unfinished = {}
+        pending_pipelines = []
+        if self.connection is None and not self.open():
+            return watermarks, unfinished, pending_pipelines
+
+        now = datetime.now(timezone.utc)
+        for name, value in self.connection.execute("SELECT name, value FROM watermarks"):
+            self.written_watermarks[name] = value
+            watermark = datetime.fromisoformat(value)
+            # watermarks written before they became timezone aware are UTC
+            if watermark.tzinfo is None:
+                watermark = watermark.replace(tzinfo=timezone.utc)
+            if (now - watermark).total_seconds() > self.max_age:
+                logger.warning(f"Checkpoint watermark {name} {value} is too old, ignored")
+                continue
+            watermarks[name] = watermark
+
+        for kind, owner_id, item_id in self.connection.execute(
+            "SELECT kind, owner_id, item_id FROM unfinished"
+        ):
+            self.written_unfinished.add((kind, owner_id, item_id))
+            unfinished.setdefault(kind, {}).setdefault(owner_id, list()).append(item_id)
+
+        for row in self.connection.execute(
+            "SELECT pipeline_id, project_id, path_with_namespace, source FROM pending_pipelines"
+        ):
+            self.written_pending_pipelines.add(row)
+            pipeline_id, project_id, path_with_namespace, source = row
+            pending_pipelines.append(
+                {
+                    "id": pipeline_id,
+                    "project": {"id": project_id, "path_with_namespace": path_with_namespace},
+                    "source": source,
+                }
+            )
+
+        logger.info(
+            f"Checkpoint loaded: {len(watermarks)} watermarks, {len(self.written_unfinished)} unfinished items, "
+            f"{len(pending_pipelines)} pipelines waiting for their jobs"
+        )
+        return watermarks, unfinished, pending_pipelines
+
+    # Function to queue a checkpoint, saves issued while one is being written are coalesced into the latest
+    def save(self, watermarks, unfinished, pending_pipelines=()):
+        if not self.enabled:
+            return
+        rows = set()
+        for kind, owners in unfinished.items():
+            for owner_id, item_ids in owners.items():
+                for item_id in item_ids:
+                    rows.add((kind, owner_id, item_id))
+        watermarks = {name: value.isoformat() for name, value in watermarks.items() if value is not None}
+        pipeline_rows = {
+            (
+                pipeline["id"],
+                pipeline["project"]["id"],
+                pipeline["project"]["path_with_namespace"],
+                pipeline["source"],
+            )
+            for pipeline in pending_pipelines
+        }
+        self.pending_state = (watermarks, rows, pipeline_rows)
+        if self.writer_task is None or self.writer_task.done():
+            self.writer_task = asyncio.create_task(self.write_pending())
+
+    # Function to write queued checkpoints in a worker thread until nothing is pending
+    async def write_pending(self):
+        loop = asyncio.get_running_loop()
+        while self.pending_state is not None:
+            watermarks, rows, pipeline_rows = self.pending_state
+            self.pending_state = None
+            try:
+                await loop.run_in_executor(None, self.write, watermarks, rows, pipeline_rows)
+            except Exception as e:
+                logger.error(f"Error occurred while writing checkpoint: {e}")
+
+    # Function to write only the rows which changed since the previous checkpoint in one transaction
+    def write(self, watermarks, rows, pipeline_rows):
+        if self.connection is None and not self.open():
+            return
+        changed_watermarks = [
+            (name, value)
+            for name, value in watermarks.items()
+            if self.written_watermarks.get(name) != value
+        ]
+        rows_to_insert = rows - self.written_unfinished
+        rows_to_delete = self.written_unfinished - rows
+        pipeline_rows_to_insert = pipeline_rows - self.written_pending_pipelines
+        pipeline_ids_to_delete = {row[0] for row in self.written_pending_pipelines} - {
+            row[0] for row in pipeline_rows
+        }
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO watermarks (name, value) VALUES (?, ?)", changed_watermarks
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO unfinished (kind, owner_id, item_id) VALUES (?, ?, ?)",
+                rows_to_insert,
+            )
+            self.connection.executemany(
+                "DELETE FROM unfinished WHERE kind = ? AND owner_id = ? AND item_id = ?",
+                rows_to_delete,
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pending_pipelines (pipeline_id, project_id, path_with_namespace, source) "
+                "VALUES (?, ?, ?, ?)",
+                pipeline_rows_to_insert,
+            )
+            self.connection.executemany(
+                "DELETE FROM pending_pipelines WHERE pipeline_id = ?",
+                [(pipeline_id,) for pipeline_id in pipeline_ids_to_delete],
+            )
+        self.written_watermarks.update(changed_watermarks)
+        self.written_unfinished = rows
+        self.written_pending_pipelines = pipeline_rows
+
+    # Function to wait for the queued checkpoint to be written, used on shutdown
+    async def flush(self):
+        if self.writer_task is not None:
+            await self.writer_task
+
+    # Function to close the database
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
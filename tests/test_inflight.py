@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gitlabApi.gitlab import GitlabApiInteraction
+from gitlabApi.inflight import InflightTracker
+from gitlabApi.records import JobRecord, PipelineRecord
+from gitlabApi.timestamps import to_epoch_micros
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PAGE_SIZE = 20
+CYCLE_SECONDS = 60
+
+
+@pytest.fixture
+def interaction(monkeypatch):
+    monkeypatch.setenv("IGNORED_SUBGROUPS_PATH_LIST", "")
+    monkeypatch.setenv("PRIVATE_ACCESS_TOKEN", "token")
+    return GitlabApiInteraction()
+
+
+def moment(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+# Previous traversal, with the tracked ids kept in a list sorted descending and scanned for every item, it's
+# the reference the trackers are compared with, returns the selected ids, the tracked ids and the pages read
+def legacy_traverse(tracked_ids, pages, window_start, window_end):
+    tracked_ids = sorted(tracked_ids, reverse=True)
+    selected = []
+    traverse_count = 0
+    unfinished_length = len(tracked_ids)
+    current_unfinished = []
+    to_remove = []
+    pages_read = 0
+    for items in pages:
+        pages_read += 1
+        stop = False
+        for item in items:
+            if stop == True and traverse_count == unfinished_length:
+                break
+            for unfinished_id in tracked_ids:
+                if item.id > unfinished_id:
+                    break
+                elif item.id < unfinished_id:
+                    continue
+                else:
+                    traverse_count += 1
+                    if item.finished_at is not None:
+                        to_remove.append(unfinished_id)
+                        break
+            if item.finished_at is None:
+                if item.id not in tracked_ids:
+                    current_unfinished.append(item.id)
+                    selected.append(item.id)
+                continue
+            if item.finished_at > window_end:
+                continue
+            elif item.finished_at <= window_start:
+                stop = True
+                continue
+            selected.append(item.id)
+        if traverse_count == unfinished_length:
+            break
+    for item_id in to_remove:
+        tracked_ids.remove(item_id)
+    tracked_ids.extend(current_unfinished)
+    return selected, sorted(tracked_ids), pages_read
+
+
+# Function to run the traversal of the exporter over the pages, returns the same as legacy_traverse
+def traverse(interaction, kind, tracker, pages, start, end):
+    pages_read = 0
+    details = {item.id: item for items in pages for item in items}
+
+    async def list_pages(owner_id):
+        nonlocal pages_read
+        for items in pages:
+            pages_read += 1
+            yield items
+
+    async def get_pipeline_details(project_id, pipeline_id):
+        return details[pipeline_id]
+
+    if kind == "pipelines":
+        interaction.get_projects_pipelines = list_pages
+        interaction.get_pipeline_details = get_pipeline_details
+        interaction.unfinished_pipelines[1] = tracker
+        items = interaction.iter_project_pipelines({"id": 1, "path_with_namespace": "g/p"}, start, end)
+    else:
+        interaction.get_runners_jobs = list_pages
+        interaction.unfinished_jobs[1] = tracker
+        items = interaction.iter_runner_jobs({"id": 1, "description": "r"}, start, end)
+
+    async def collect():
+        return [item_id async for item_id, _ in items]
+
+    selected = asyncio.run(collect())
+    return selected, sorted(tracker), pages_read
+
+
+# Pipelines or jobs of a project or runner, created and finished as the clock moves, listed by id descending
+class History:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.now = 0
+        self.finishes = {}  # id -> second it finishes at
+        self.vanished = set()
+
+    def advance(self):
+        for _ in range(self.random.randrange(0, 15)):
+            duration = self.random.expovariate(1 / CYCLE_SECONDS)
+            # a few run for many cycles, so the tracked ids spread over several pages
+            if self.random.random() < 0.1:
+                duration *= 20
+            self.finishes[len(self.finishes) + 1] = self.now + duration
+        self.now += CYCLE_SECONDS
+
+    def item(self, kind, item_id):
+        finish = self.finishes[item_id]
+        finished_at = moment(finish).isoformat() if finish <= self.now else None
+        status = "running" if finished_at is None else "success"
+        if kind == "pipelines":
+            return PipelineRecord(
+                {"id": item_id, "status": status, "ref": "main", "source": "push", "finished_at": finished_at}
+            )
+        return JobRecord(
+            {
+                "id": item_id,
+                "name": "build",
+                "ref": "main",
+                "status": status,
+                "finished_at": finished_at,
+                "duration": 1,
+                "queued_duration": 0,
+                "pipeline": {"id": 1, "source": "push"},
+                "project": {"id": 1, "path_with_namespace": "g/p"},
+            }
+        )
+
+    def pages(self, kind):
+        item_ids = sorted(set(self.finishes) - self.vanished, reverse=True)
+        items = [self.item(kind, item_id) for item_id in item_ids]
+        return [items[position:position + PAGE_SIZE] for position in range(0, len(items), PAGE_SIZE)]
+
+
+# Function to run a cycle of both traversals over the same listing, from the same tracked ids
+def run_cycle(interaction, kind, history, tracked_ids):
+    start = moment(history.now)
+    history.advance()
+    end = moment(history.now)
+    pages = history.pages(kind)
+    expected = legacy_traverse(tracked_ids, pages, to_epoch_micros(start), to_epoch_micros(end))
+    result = traverse(interaction, kind, InflightTracker(tracked_ids), pages, start, end)
+    return expected, result
+
+
+def test_min_id_follows_adds_and_removes():
+    tracker = InflightTracker([30, 10, 20])
+    assert tracker.min_id == 10
+    tracker.add(5)
+    assert tracker.min_id == 5
+    tracker.remove(5)
+    tracker.remove(10)
+    assert tracker.min_id == 20
+    tracker.difference_update([20, 30])
+    assert tracker.min_id is None
+    assert not tracker.below_watermark(1)
+
+
+@pytest.mark.parametrize("kind", ["pipelines", "jobs"])
+@pytest.mark.parametrize("seed", range(40))
+def test_traversal_matches_legacy(interaction, kind, seed):
+    history = History(seed)
+    tracked_ids = []
+    for _ in range(15):
+        expected, result = run_cycle(interaction, kind, history, tracked_ids)
+        assert result == expected
+        tracked_ids = expected[1]
+
+
+# A tracked id missing from the listing (a deleted pipeline or job) is never seen, so traverse_count never
+# reaches the tracked length, the traversal used to page through the whole history, it now stops on the
+# first page going below the lowest tracked id
+@pytest.mark.parametrize("kind", ["pipelines", "jobs"])
+def test_vanished_tracked_id_stops_at_watermark(interaction, kind):
+    history = History(0)
+    history.finishes = {item_id: 0 for item_id in range(1, 101)}
+    # 100 starts in the cycle, 95 finishes in it and 10 is running since before every tracked id
+    history.finishes.update({100: 10 * CYCLE_SECONDS, 95: 30, 10: 10 * CYCLE_SECONDS})
+    history.vanished = {42}
+    history.now = CYCLE_SECONDS
+    start, end = moment(1), moment(history.now)
+    pages = history.pages(kind)
+
+    legacy_selected, legacy_tracked, legacy_pages = legacy_traverse(
+        [95, 42], pages, to_epoch_micros(start), to_epoch_micros(end)
+    )
+    result = traverse(interaction, kind, InflightTracker([95, 42]), pages, start, end)
+
+    assert legacy_pages == 5
+    assert result[2] == 3
+    # both keep the vanished id tracked
+    assert 42 in legacy_tracked and 42 in result[1]
+    # the running item below the watermark isn't reached anymore
+    assert legacy_selected == [100, 95, 10]
+    assert result[0] == [100, 95]
+    assert result[1] == [42, 100]
+
+
+@pytest.mark.parametrize("kind", ["pipelines", "jobs"])
+@pytest.mark.parametrize("seed", range(40))
+def test_vanished_tracked_id_only_skips_below_watermark(interaction, kind, seed):
+    history = History(seed)
+    tracked_ids = []
+    while len(tracked_ids) < 2:
+        expected, _ = run_cycle(interaction, kind, history, tracked_ids)
+        tracked_ids = expected[1]
+    history.vanished.add(history.random.choice(tracked_ids))
+    watermark = min(tracked_ids)
+
+    (legacy_selected, legacy_tracked, legacy_pages), (selected, tracked, pages) = run_cycle(
+        interaction, kind, history, tracked_ids
+    )
+
+    assert pages <= legacy_pages
+    assert selected == [item_id for item_id in legacy_selected if item_id in selected]
+    assert all(item_id < watermark for item_id in set(legacy_selected) - set(selected))
+    assert set(tracked) <= set(legacy_tracked)
+    assert all(item_id < watermark for item_id in set(legacy_tracked) - set(tracked))